@@ -10,30 +10,148 @@ Date: 2025-05-31
 
 import os
 import sys
+import json
 import logging
 import unicodedata
+import threading
+import queue
+import random
+import socket
+import time
+import hashlib
+import hmac
+import importlib
+import ipaddress
+import mmap
+import sqlite3
+import urllib.request
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
+from urllib.parse import urlparse
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
 
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.preprocessing.image import load_img, img_to_array
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash
+from flask import Flask, Request, request, g, has_request_context, jsonify, render_template, redirect, url_for, flash
 from flask_cors import CORS
 from PIL import Image
 import io
 
+# ================= TUNED SETTINGS ================= #
+# Written per host by `python benchmark.py tune`; environment variables still win
+TUNING_FILE = os.environ.get('TUNING_FILE', './tuning.json')
+
+def _load_tuning(path: str) -> dict:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('config', {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+TUNED_SETTINGS = _load_tuning(TUNING_FILE)
+
+def _setting(name: str, default):
+    """Environment variable, else tuned value, else default"""
+    return os.environ.get(name, TUNED_SETTINGS.get(name, default))
+
 # ================= CONFIGURATION ================= #
 class Config:
     # Model Configuration
     IMG_SIZE = 224
+    # Let the JPEG decoder downscale in the DCT domain to the smallest scale still >= IMG_SIZE
+    JPEG_DRAFT_DECODE = os.environ.get('JPEG_DRAFT_DECODE', 'true').lower() == 'true'
     TFLITE_PATH = os.environ.get('TFLITE_PATH', './InceptionResNetV2_improved.tflite')
+    # auto | tflite_runtime | ai_edge_litert | tensorflow
+    TFLITE_BACKEND = os.environ.get('TFLITE_BACKEND', 'auto').lower()
     
     # Flask Configuration
     SECRET_KEY = os.environ.get('SECRET_KEY', 'plant-disease-ai-secret-key-2025')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
+    # Batch Inference Configuration
+    MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 32))  # images per interpreter invoke
+    MAX_BATCH_IMAGES = int(os.environ.get('MAX_BATCH_IMAGES', 64))  # images per /predict/batch request
+    TOP_K_PREDICTIONS = 10
+    
+    # Micro-batching Configuration (groups concurrent /predict calls into one invoke)
+    MICRO_BATCH_ENABLED = os.environ.get('MICRO_BATCH_ENABLED', 'true').lower() == 'true'
+    MICRO_BATCH_WINDOW_MS = float(os.environ.get('MICRO_BATCH_WINDOW_MS', 5))
+    MICRO_BATCH_MAX_SIZE = int(os.environ.get('MICRO_BATCH_MAX_SIZE', 8))
+    # Batches are padded up to one of these sizes (past the largest, to a multiple of it), so
+    # interpreters are not resized and their delegate re-prepared for every micro-batch size
+    INTERPRETER_BATCH_SIZES = sorted({
+        int(size) for size in os.environ.get('INTERPRETER_BATCH_SIZES', '1,4,8').split(',') if size.strip()
+    })
+    
+    # Serving Configuration (pre-forked gunicorn server, see gunicorn.conf.py)
+    WORKERS = int(_setting('WORKERS', 1))
+    WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 8))
+    MAX_REQUESTS_PER_WORKER = int(os.environ.get('MAX_REQUESTS_PER_WORKER', 2000))
+    # Optional hex sha256 the model file must match before workers start
+    MODEL_SHA256 = os.environ.get('MODEL_SHA256', '').lower()
+    
+    # Interpreter Pool Configuration
+    INTERPRETER_THREADS = int(_setting('INTERPRETER_THREADS', 4))
+    # 0 = share the cores between the WORKERS processes, one interpreter per INTERPRETER_THREADS cores
+    INTERPRETER_POOL_SIZE = int(_setting('INTERPRETER_POOL_SIZE', 0)) or max(
+        1, (os.cpu_count() or 1) // (INTERPRETER_THREADS * max(1, WORKERS))
+    )
+    
+    # Model Registry Configuration (named/versioned models, see load_model_specs; absent file = TFLITE_PATH only)
+    MODEL_REGISTRY_FILE = os.environ.get('MODEL_REGISTRY_FILE', './models.json')
+    MODEL_RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 0))  # seconds, 0 = reload on request only
+    SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', 0.05))  # share of requests re-run on shadow models
+    MODEL_ADMIN_TOKEN = os.environ.get('MODEL_ADMIN_TOKEN', '')  # X-Admin-Token for POST /models/reload; unset = disabled
+    
+    # Cascade Configuration (optional small screen model; the main model only runs when it is unsure)
+    SCREEN_MODEL_PATH = os.environ.get('SCREEN_MODEL_PATH', '')
+    # Screen answers when its top confidence, after the plant filter, is at least this
+    SCREEN_CONFIDENCE_THRESHOLD = float(os.environ.get('SCREEN_CONFIDENCE_THRESHOLD', 0.9))
+    SCREEN_INTERPRETER_THREADS = int(os.environ.get('SCREEN_INTERPRETER_THREADS', 1))
+    
+    # Prediction Cache Configuration (0 entries disables the cache, empty dir disables the disk tier)
+    PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+    PREDICTION_CACHE_TTL = int(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+    PREDICTION_CACHE_DIR = os.environ.get('PREDICTION_CACHE_DIR', '')
+    # Disk tier bound: expired files are swept and the oldest removed beyond this many
+    PREDICTION_CACHE_DISK_MAX_ENTRIES = int(os.environ.get('PREDICTION_CACHE_DISK_MAX_ENTRIES', 20000))
+    
+    # Near-duplicate Index (opt-in; reuses a prediction for perceptually near-identical images)
+    NEAR_DUPLICATE_ENABLED = os.environ.get('NEAR_DUPLICATE_ENABLED', 'false').lower() == 'true'
+    NEAR_DUPLICATE_ALGORITHM = os.environ.get('NEAR_DUPLICATE_ALGORITHM', 'phash').lower()  # phash | dhash
+    NEAR_DUPLICATE_RADIUS = int(os.environ.get('NEAR_DUPLICATE_RADIUS', 6))  # max Hamming distance of 64 bits
+    NEAR_DUPLICATE_MAX_ENTRIES = int(os.environ.get('NEAR_DUPLICATE_MAX_ENTRIES', 10000))
+    
+    # Async Job Configuration (POST /jobs, results via GET /jobs/<id> or callback)
+    JOBS_ENABLED = os.environ.get('JOBS_ENABLED', 'true').lower() == 'true'
+    JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH', './jobs.db')
+    # 0 = one job worker per pooled interpreter
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 0)) or INTERPRETER_POOL_SIZE
+    JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 10000))  # 0 = unbounded
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 86400))
+    JOB_CALLBACK_TIMEOUT = float(os.environ.get('JOB_CALLBACK_TIMEOUT', 10))
+    JOB_CALLBACK_RETRIES = int(os.environ.get('JOB_CALLBACK_RETRIES', 3))
+    # Comma-separated callback hosts (e.g. the backend's service name). Empty = any host
+    # that resolves to public addresses only; loopback/private/link-local are refused
+    JOB_CALLBACK_ALLOWED_HOSTS = frozenset(
+        host.strip().lower() for host in os.environ.get('JOB_CALLBACK_ALLOWED_HOSTS', '').split(',') if host.strip()
+    )
+    
+    # Predict-by-reference: root of a volume shared with the backend (empty disables image_path/image_hash)
+    SHARED_IMAGE_ROOT = os.environ.get('SHARED_IMAGE_ROOT', '')
+    
+    # Admission Control (prediction/upload endpoints; excess requests get 503 + Retry-After)
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+    # 0 = enough concurrent requests to fill every interpreter's micro-batch
+    ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 0)) or INTERPRETER_POOL_SIZE * MICRO_BATCH_MAX_SIZE
+    ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 32))
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 10))
+    
     # Upload Configuration
     UPLOAD_FOLDER = 'uploads'
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
@@ -164,64 +282,1413 @@ PLANT_ALIAS = {
     'tomato': 'Tomato'
 }
 
+# ================= CLASS METADATA ================= #
+# Built once at import time so request handling never scans class names
+NUM_CLASSES = len(ALL_CLASSES)
+CLASS_NAMES_VI = [VIET_NAMES.get(c, c) for c in ALL_CLASSES]
+CLASS_PREFIXES = [c.split('___')[0] for c in ALL_CLASSES]
+HEALTHY_MASK = np.array(['healthy' in c.lower() for c in ALL_CLASSES])
+PLANT_CLASS_INDICES = {
+    prefix: np.array([i for i, p in enumerate(CLASS_PREFIXES) if p == prefix], dtype=np.intp)
+    for prefix in sorted(set(CLASS_PREFIXES))
+}
+
+# ================= IMAGE DECODING ================= #
+def open_image_rgb(source) -> Image.Image:
+    """Decode an image (path or byte stream) to RGB.
+
+    Large JPEGs are decoded at a reduced scale (1/2, 1/4 or 1/8) that still
+    covers IMG_SIZE x IMG_SIZE; other formats are decoded at full size.
+    """
+    with Image.open(source) as image:
+        if Config.JPEG_DRAFT_DECODE and image.format == 'JPEG':
+            image.draft('RGB', (Config.IMG_SIZE, Config.IMG_SIZE))
+        return image.convert('RGB')
+
+def image_to_array(image: Image.Image) -> np.ndarray:
+    """Decoded image -> (IMG_SIZE, IMG_SIZE, 3) uint8 model input"""
+    # Same conversion and resampling as Keras load_img/img_to_array
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    target_size = (Config.IMG_SIZE, Config.IMG_SIZE)
+    if image.size != target_size:
+        image = image.resize(target_size, Image.NEAREST)
+    return np.asarray(image, dtype=np.uint8)
+
+# ================= SHARED VOLUME ================= #
+SHARED_IMAGE_HASH_LENGTH = 64  # hex sha256
+
+def resolve_shared_image(root: str, image_path: str = None, image_hash: str = None) -> str:
+    """Map a client reference (relative path or sha256 content hash) to a file inside root.
+
+    Raises ValueError for references that are malformed or escape root, and
+    FileNotFoundError when nothing matches. Hash references look for
+    <root>/<hash>.<ext> with any allowed image extension.
+    """
+    root = os.path.realpath(root)
+    
+    if image_hash:
+        image_hash = image_hash.lower()
+        if len(image_hash) != SHARED_IMAGE_HASH_LENGTH or any(c not in '0123456789abcdef' for c in image_hash):
+            raise ValueError('image_hash must be a hex sha256 digest')
+        candidates = [os.path.join(root, f"{image_hash}.{ext}") for ext in sorted(Config.ALLOWED_EXTENSIONS)]
+    else:
+        if not image_path or '\x00' in image_path or os.path.isabs(image_path):
+            raise ValueError('image_path must be a path relative to the shared volume')
+        candidates = [os.path.join(root, image_path)]
+    
+    for candidate in candidates:
+        # Resolve symlinks and '..' before checking containment
+        path = os.path.realpath(candidate)
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError('image_path points outside the shared volume')
+        if os.path.isfile(path):
+            return path
+    
+    raise FileNotFoundError('Image not found on the shared volume')
+
+def read_image_file(path: str) -> bytes:
+    """Read an image from the shared volume into memory.
+    
+    Not mmap'd: other processes may rewrite or truncate the file while it is
+    in use, and touching a truncated mapping kills the worker with SIGBUS.
+    """
+    too_large = ValueError(f'Image file too large. Maximum size is {Config.MAX_CONTENT_LENGTH // (1024*1024)}MB')
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size > Config.MAX_CONTENT_LENGTH:
+            raise too_large
+        # The file may have grown since fstat; never read more than the limit
+        data = f.read(Config.MAX_CONTENT_LENGTH + 1)
+    if not data:
+        raise ValueError('Image file is empty')
+    if len(data) > Config.MAX_CONTENT_LENGTH:
+        raise too_large
+    return data
+
+# ================= METRICS ================= #
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels) + '}'
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+    
+    def render(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(values.items())]
+        return lines
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time, or set/inc/dec directly"""
+    
+    metric_type = 'gauge'
+    
+    def __init__(self, name: str, documentation: str, callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self._value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+    
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+    
+    def render(self) -> list:
+        if self.callback is not None:
+            value = self.callback()
+        else:
+            with self._lock:
+                value = self._value
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+            f"{self.name} {value}"
+        ]
+
+class CounterCallback(Gauge):
+    """Monotonic total owned by another component and read at scrape time"""
+    
+    metric_type = 'counter'
+
+class Histogram:
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    
+    def __init__(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+    
+    def render(self) -> list:
+        with self._lock:
+            series = {key: {'counts': list(v['counts']), 'sum': v['sum'], 'count': v['count']}
+                      for key, v in self._series.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values['counts']):
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {values['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {values['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {values['count']}")
+        return lines
+
+class MetricsRegistry:
+    """Minimal Prometheus text-format registry (exposition format 0.0.4)"""
+    
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+    
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+METRICS = MetricsRegistry()
+REQUEST_DURATION = METRICS.register(Histogram(
+    'plant_disease_request_duration_seconds', 'HTTP request latency by endpoint'
+))
+STAGE_DURATION = METRICS.register(Histogram(
+    'plant_disease_stage_duration_seconds', 'Time spent per processing stage'
+))
+REQUESTS_IN_FLIGHT = METRICS.register(Gauge(
+    'plant_disease_requests_in_flight', 'Requests currently being handled'
+))
+CASCADE_ANSWERS = METRICS.register(Counter(
+    'plant_disease_cascade_answers_total', 'Predictions answered per cascade stage (screen or full model; cache/dedup when no model ran)'
+))
+MODEL_IMAGES = METRICS.register(Counter(
+    'plant_disease_model_images_total', 'Images predicted per registry model'
+))
+MODEL_LATENCY = METRICS.register(Histogram(
+    'plant_disease_model_latency_seconds', 'Predict call latency per registry model'
+))
+MODEL_SHADOW_COMPARISONS = METRICS.register(Counter(
+    'plant_disease_model_shadow_comparisons_total', 'Shadow model comparisons by top-1 agreement'
+))
+ERRORS = METRICS.register(Counter(
+    'plant_disease_errors_total', 'Errors by type'
+))
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration, labelled with the endpoint of the current request if any"""
+    if has_request_context() and request.url_rule is not None:
+        endpoint = request.url_rule.rule
+    else:
+        endpoint = 'worker'
+    STAGE_DURATION.observe(seconds, stage=stage, endpoint=endpoint)
+
+# ================= TFLITE RUNTIME ================= #
+# Interpreter-only packages first: importing full TensorFlow costs seconds of
+# cold start and hundreds of MB of RSS for nothing but tf.lite.Interpreter.
+_INTERPRETER_BACKENDS = {
+    'tflite_runtime': 'tflite_runtime.interpreter',
+    'ai_edge_litert': 'ai_edge_litert.interpreter',
+    'tensorflow': 'tensorflow',
+}
+_interpreter_class = None
+_interpreter_backend = None
+
+def load_interpreter_class():
+    """Import the TFLite Interpreter class lazily from the configured backend"""
+    global _interpreter_class, _interpreter_backend
+    if _interpreter_class is not None:
+        return _interpreter_class
+    
+    if Config.TFLITE_BACKEND == 'auto':
+        candidates = list(_INTERPRETER_BACKENDS)
+    elif Config.TFLITE_BACKEND in _INTERPRETER_BACKENDS:
+        candidates = [Config.TFLITE_BACKEND]
+    else:
+        raise ValueError(f"Unknown TFLITE_BACKEND: {Config.TFLITE_BACKEND}")
+    
+    for backend in candidates:
+        try:
+            module = importlib.import_module(_INTERPRETER_BACKENDS[backend])
+        except ImportError:
+            continue
+        _interpreter_class = module.lite.Interpreter if backend == 'tensorflow' else module.Interpreter
+        _interpreter_backend = backend
+        logging.getLogger(__name__).info(f"Using TFLite interpreter from {backend}")
+        return _interpreter_class
+    
+    raise ImportError(f"No TFLite interpreter available (tried: {', '.join(candidates)})")
+
+def interpreter_backend() -> str:
+    return _interpreter_backend
+
+def input_quantization(dtype, quantization) -> tuple:
+    """(scale, zero_point) as float32 scalars for a quantized input, None for float32 inputs"""
+    if dtype == np.float32:
+        return None
+    scale, zero_point = quantization
+    return np.float32(scale), np.float32(zero_point)
+
+# Rows per float32 scratch pass for quantized inputs (about 300 KB at 224x224x3)
+_QUANTIZE_CHUNK_ROWS = 112
+
+def fill_input_tensor(input_view: np.ndarray, image_arrays: list, quantization: tuple = None):
+    """Preprocess uint8 images straight into the interpreter's input buffer.
+
+    Float inputs are divided in place by one fused ufunc. Quantized inputs get
+    the same float32 arithmetic as ((x / 255) / scale + zero_point).astype(dtype),
+    in one reused scratch buffer of a few rows, then a casting copy into the
+    tensor. Neither path materializes a full-size temporary per image.
+    A uint8 lookup table gives the same values, but its gather is slower.
+    """
+    scratch = None
+    for row, image_array in zip(input_view, image_arrays):
+        if quantization is None:
+            np.divide(image_array, np.float32(255.0), out=row)
+            continue
+        
+        scale, zero_point = quantization
+        if scratch is None:
+            scratch = np.empty((min(_QUANTIZE_CHUNK_ROWS, len(image_array)),) + image_array.shape[1:], np.float32)
+        for start in range(0, len(image_array), _QUANTIZE_CHUNK_ROWS):
+            chunk = image_array[start:start + _QUANTIZE_CHUNK_ROWS]
+            values = scratch[:len(chunk)]
+            np.divide(chunk, np.float32(255.0), out=values)
+            np.divide(values, scale, out=values)
+            np.add(values, zero_point, out=values)
+            np.copyto(row[start:start + len(chunk)], values, casting='unsafe')
+
+# ================= MODEL FILE ================= #
+TFLITE_FILE_IDENTIFIER = b'TFL3'
+
+def resolve_model_path(model_path: str) -> str:
+    """Return the model location; only TFLITE_PATH falls back to the usual container paths.
+
+    Any other path (a registry entry) must exist as given, so a typo never
+    serves the default model under another model's name.
+    """
+    possible_paths = [model_path]
+    if model_path == Config.TFLITE_PATH:
+        possible_paths += [
+            os.path.join(os.getcwd(), 'InceptionResNetV2_improved.tflite'),
+            os.path.join('/app', 'InceptionResNetV2_improved.tflite'),
+            os.path.join('/app/model', 'InceptionResNetV2_improved.tflite')
+        ]
+    for path in possible_paths:
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"❌ Model file not found in any of: {possible_paths}")
+
+def map_model_file(model_path: str) -> mmap.mmap:
+    """Memory-map the model read-only and ask the kernel to page it in.
+
+    Interpreters built from model_path map the same file, so every worker
+    shares these page-cache pages instead of holding a private copy.
+    """
+    with open(model_path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+        mapped.madvise(mmap.MADV_WILLNEED)
+    return mapped
+
+def verify_model_file(model_path: str, expected_sha256: str = '') -> dict:
+    """Check that the file is a TFLite flatbuffer (and matches expected_sha256 if given)"""
+    mapped = map_model_file(model_path)
+    try:
+        if len(mapped) < 8 or mapped[4:8] != TFLITE_FILE_IDENTIFIER:
+            raise ValueError(f"{model_path} is not a TFLite model (missing {TFLITE_FILE_IDENTIFIER!r} identifier)")
+        
+        info = {'path': model_path, 'size_bytes': len(mapped)}
+        if expected_sha256:
+            digest = hashlib.sha256(mapped).hexdigest()
+            if digest != expected_sha256:
+                raise ValueError(f"{model_path} sha256 {digest} does not match MODEL_SHA256 {expected_sha256}")
+            info['sha256'] = digest
+        return info
+    finally:
+        mapped.close()
+
+# ================= ADMISSION CONTROL ================= #
+class AdmissionController:
+    """Bound how many expensive requests run at once and how many may wait.
+
+    acquire() takes a slot immediately, waits in a bounded queue for up to
+    queue_timeout seconds, or refuses. Refusing early keeps latency and the
+    memory held by buffered uploads bounded under bursts.
+    """
+    
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Smoothed time a request holds its slot, used for Retry-After
+        self._avg_hold = 0.0
+    
+    def acquire(self) -> bool:
+        """Take a slot; returns False when the queue is full or the wait timed out"""
+        with self._cond:
+            if self.active < self.max_concurrent and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return True
+            
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            
+            self.waiting += 1
+            try:
+                admitted = self._cond.wait_for(lambda: self.active < self.max_concurrent, self.queue_timeout)
+            finally:
+                self.waiting -= 1
+            
+            if not admitted:
+                self.rejected += 1
+                return False
+            self.active += 1
+            self.admitted += 1
+            return True
+    
+    def release(self, held_seconds: float):
+        with self._cond:
+            self.active -= 1
+            self._avg_hold = held_seconds if not self._avg_hold else 0.9 * self._avg_hold + 0.1 * held_seconds
+            self._cond.notify()
+    
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained, at least 1"""
+        with self._cond:
+            backlog = self.active + self.waiting
+            return max(1, int(round(backlog * self._avg_hold / self.max_concurrent)))
+    
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'enabled': True,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout_seconds': self.queue_timeout,
+                'active': self.active,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected
+            }
+
+# ================= MICRO-BATCH SCHEDULER ================= #
+class MicroBatcher:
+    """Queue single-image requests and run them through the model in small batches.
+
+    Each worker thread waits for the first request, then keeps collecting until
+    the window expires or max_batch_size is reached, runs one batched call and
+    hands each row back to its caller's Future. Run one worker per interpreter
+    so every pooled interpreter can be kept busy.
+    """
+    
+    def __init__(self, run_batch, window_ms: float, max_batch_size: int, num_workers: int = 1):
+        self.run_batch = run_batch
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.logger = logging.getLogger(__name__)
+        
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches_run = 0
+        self.items_run = 0
+        
+        self._workers = [
+            threading.Thread(target=self._run, name=f'micro-batcher-{i}', daemon=True)
+            for i in range(max(1, num_workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+    
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+    
+    def submit(self, image_array: np.ndarray) -> np.ndarray:
+        """Enqueue one image and block until its probability vector is ready"""
+        future = Future()
+        self._queue.put((image_array, future))
+        return future.result()
+    
+    def close(self):
+        """Stop the workers once the queue drains; no submit() may follow"""
+        for _ in self._workers:
+            self._queue.put(None)
+    
+    def _collect(self) -> list:
+        first = self._queue.get()
+        if first is None:
+            return None
+        items = [first]
+        deadline = time.monotonic() + self.window
+        
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Leave the stop marker for the next _collect, after this batch runs
+                self._queue.put(None)
+                break
+            items.append(item)
+        
+        return items
+    
+    def _run(self):
+        while True:
+            items = self._collect()
+            if items is None:
+                return
+            
+            try:
+                probabilities = self.run_batch([arr for arr, _ in items])
+                for row, (_, future) in enumerate(items):
+                    future.set_result(probabilities[row])
+            except Exception as e:
+                self.logger.error(f"Micro-batch inference error: {str(e)}")
+                for _, future in items:
+                    future.set_exception(e)
+            
+            with self._stats_lock:
+                self.batches_run += 1
+                self.items_run += len(items)
+    
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches, items = self.batches_run, self.items_run
+        return {
+            'enabled': True,
+            'window_ms': self.window * 1000,
+            'max_batch_size': self.max_batch_size,
+            'workers': len(self._workers),
+            'queue_depth': self.queue_depth,
+            'batches_run': batches,
+            'avg_batch_size': round(items / batches, 2) if batches else 0.0
+        }
+
+# ================= INTERPRETER POOL ================= #
+def padded_batch_size(batch_size: int, sizes: list = None) -> int:
+    """Smallest allowed interpreter batch size that fits batch_size (INTERPRETER_BATCH_SIZES)"""
+    sizes = sizes or Config.INTERPRETER_BATCH_SIZES
+    if not sizes:
+        return batch_size
+    for size in sizes:
+        if size >= batch_size:
+            return size
+    return -(-batch_size // sizes[-1]) * sizes[-1]
+
+class PooledInterpreter:
+    """One TFLite interpreter plus its tensor details and current batch size"""
+    
+    def __init__(self, model_path: str, num_threads: int):
+        self.interpreter = load_interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._refresh_details()
+        self.resizes = 0
+    
+    def _refresh_details(self):
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+    
+    def ensure_batch_size(self, batch_size: int) -> bool:
+        """Resize the interpreter input when the batch dimension changes; True if it was resized"""
+        if self.input_details['shape'][0] == batch_size:
+            return False
+        
+        self.interpreter.resize_tensor_input(
+            self.input_details['index'],
+            [batch_size, *self.input_details['shape'][1:]]
+        )
+        self.interpreter.allocate_tensors()
+        self._refresh_details()
+        self.resizes += 1
+        return True
+
+class InterpreterPool:
+    """Fixed-size pool of interpreters; each request checks one out exclusively"""
+    
+    def __init__(self, model_path: str, size: int, num_threads: int):
+        self.size = max(1, size)
+        self.num_threads = num_threads
+        self._available = queue.LifoQueue()
+        self._stats_lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        
+        self.interpreters = [PooledInterpreter(model_path, num_threads) for _ in range(self.size)]
+        for handle in self.interpreters:
+            self._available.put(handle)
+    
+    @property
+    def input_details(self) -> dict:
+        return self.interpreters[0].input_details
+    
+    @property
+    def output_details(self) -> dict:
+        return self.interpreters[0].output_details
+    
+    @contextmanager
+    def checkout(self):
+        """Borrow an interpreter for the duration of the with-block"""
+        with self._stats_lock:
+            self.waiting += 1
+        try:
+            handle = self._available.get()
+        finally:
+            with self._stats_lock:
+                self.waiting -= 1
+        
+        with self._stats_lock:
+            self.in_use += 1
+            self.checkouts += 1
+        try:
+            yield handle
+        finally:
+            with self._stats_lock:
+                self.in_use -= 1
+            self._available.put(handle)
+    
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'size': self.size,
+                'threads_per_interpreter': self.num_threads,
+                'in_use': self.in_use,
+                'available': self.size - self.in_use,
+                'waiting': self.waiting,
+                'total_checkouts': self.checkouts,
+                'batch_resizes': sum(handle.resizes for handle in self.interpreters)
+            }
+
+# ================= PREDICTION CACHE ================= #
+class PredictionCache:
+    """LRU + TTL cache of raw probability vectors keyed by image content hash.
+
+    Only the unfiltered model output is stored, so any plant_type filter can
+    be applied to a cached entry. An optional disk tier keeps entries as .npy
+    files so they survive restarts; a background sweep drops expired files and
+    keeps at most disk_max_entries of the newest.
+    """
+    
+    DISK_SWEEP_INTERVAL = 60  # seconds
+    
+    def __init__(self, max_entries: int, ttl_seconds: int, disk_dir: str = '', disk_max_entries: int = 20000):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.disk_dir = disk_dir or None
+        self.disk_max_entries = max(1, disk_max_entries)
+        self.logger = logging.getLogger(__name__)
+        
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self._disk_writes = 0
+        self._last_sweep = 0.0
+        self._sweeping = False
+        
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._maybe_sweep_disk(force=True)
+    
+    @staticmethod
+    def content_digest(data: bytes) -> bytes:
+        """Digest of raw image bytes, so callers can drop the bytes before a model is picked"""
+        return hashlib.blake2b(data, digest_size=16).digest()
+    
+    @staticmethod
+    def make_key(content_digest: bytes, namespace: str = '') -> str:
+        """Key for an image's content digest; namespace ties keys to one model so a new model never reuses old outputs"""
+        digest = hashlib.blake2b(namespace.encode(), digest_size=16)
+        digest.update(content_digest)
+        return digest.hexdigest()
+    
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.npy")
+    
+    def _get_from_disk(self, key: str):
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+    
+    def get(self, key: str):
+        """Return the cached probability vector or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, probabilities = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return probabilities
+                del self._entries[key]
+        
+        probabilities = self._get_from_disk(key) if self.disk_dir else None
+        
+        with self._lock:
+            if probabilities is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        
+        self._put_memory(key, probabilities)
+        return probabilities
+    
+    def _put_memory(self, key: str, probabilities: np.ndarray):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), probabilities)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def put(self, key: str, probabilities: np.ndarray):
+        probabilities = np.array(probabilities, dtype=np.float32)
+        probabilities.setflags(write=False)
+        self._put_memory(key, probabilities)
+        
+        if self.disk_dir:
+            # Write then rename so readers never see a partial file
+            tmp_path = f"{self._disk_path(key)}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, probabilities)
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError as e:
+                self.logger.warning(f"Prediction cache disk write failed: {str(e)}")
+            self._maybe_sweep_disk()
+    
+    def _maybe_sweep_disk(self, force: bool = False):
+        """Start a background sweep every DISK_SWEEP_INTERVAL or after a tenth of the bound in writes"""
+        now = time.monotonic()
+        with self._lock:
+            self._disk_writes += 0 if force else 1
+            due = (force or now - self._last_sweep >= self.DISK_SWEEP_INTERVAL
+                   or self._disk_writes >= max(1, self.disk_max_entries // 10))
+            if self._sweeping or not due:
+                return
+            self._sweeping = True
+            self._last_sweep = now
+            self._disk_writes = 0
+        threading.Thread(target=self._sweep_disk, name='prediction-cache-sweep', daemon=True).start()
+    
+    def _sweep_disk(self):
+        """Remove expired files (and stale temp files), then the oldest beyond disk_max_entries.
+        
+        Other worker processes may share the directory and sweep concurrently,
+        so files vanishing underneath are expected.
+        """
+        removed = 0
+        try:
+            cutoff = time.time() - self.ttl
+            files = []
+            with os.scandir(self.disk_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(('.npy', '.tmp')):
+                        continue
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if mtime < cutoff:
+                        removed += self._remove_file(entry.path)
+                    elif entry.name.endswith('.npy'):
+                        files.append((mtime, entry.path))
+            
+            excess = len(files) - self.disk_max_entries
+            if excess > 0:
+                files.sort()
+                for _, path in files[:excess]:
+                    removed += self._remove_file(path)
+        except OSError as e:
+            self.logger.warning(f"Prediction cache disk sweep failed: {str(e)}")
+        finally:
+            with self._lock:
+                self.disk_evictions += removed
+                self._sweeping = False
+    
+    @staticmethod
+    def _remove_file(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+    
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'enabled': True,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'disk_tier': self.disk_dir is not None,
+                'disk_max_entries': self.disk_max_entries if self.disk_dir else None,
+                'disk_evictions': self.disk_evictions,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
+
+# ================= NEAR-DUPLICATE INDEX ================= #
+PHASH_SIZE = 32
+# DCT-II basis for pHash, built once
+_DCT_MATRIX = np.cos(
+    np.pi * (2 * np.arange(PHASH_SIZE)[None, :] + 1) * np.arange(PHASH_SIZE)[:, None] / (2 * PHASH_SIZE)
+)
+
+# Both hashes take the decoded image rather than the nearest-resized model input,
+# whose aliasing would make them far less stable under re-encoding and rescaling
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 grayscale thumbnail"""
+    gray = np.asarray(image.convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def phash(image: Image.Image) -> int:
+    """64-bit perceptual hash: low 8x8 DCT coefficients of a 32x32 thumbnail against their median"""
+    gray = np.asarray(image.convert('L').resize((PHASH_SIZE, PHASH_SIZE), Image.BILINEAR), dtype=np.float64)
+    low = (_DCT_MATRIX @ gray @ _DCT_MATRIX.T)[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+PERCEPTUAL_HASHES = {'dhash': dhash, 'phash': phash}
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes for Hamming-radius queries.
+
+    Each node is [hash, {distance: child}]; the triangle inequality limits a
+    query to children whose edge distance is within radius of the query's.
+    """
+    
+    def __init__(self, hashes=()):
+        self.root = None
+        self.size = 0
+        for value in hashes:
+            self.add(value)
+    
+    def add(self, value: int):
+        if self.root is None:
+            self.root = [value, {}]
+            self.size = 1
+            return
+        
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                self.size += 1
+                return
+            node = child
+    
+    def search(self, value: int, radius: int) -> list:
+        """All (distance, hash) within radius, closest first"""
+        if self.root is None:
+            return []
+        
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= radius:
+                found.append((distance, node[0]))
+            for edge, child in node[1].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        
+        found.sort()
+        return found
+
+class NearDuplicateIndex:
+    """Map perceptually near-identical images to an already computed probability vector.
+
+    Complements the exact byte-hash PredictionCache: re-encodes, small crops and
+    resizes change the bytes but not the perceptual hash (within radius bits).
+    The BK-tree cannot delete, so eviction drops the oldest tenth of entries and
+    rebuilds it.
+    """
+    
+    def __init__(self, max_entries: int, radius: int, ttl_seconds: int, algorithm: str = 'phash'):
+        if algorithm not in PERCEPTUAL_HASHES:
+            raise ValueError(f"Unknown perceptual hash {algorithm!r}; choose from {sorted(PERCEPTUAL_HASHES)}")
+        self.max_entries = max(1, max_entries)
+        self.radius = radius
+        self.ttl = ttl_seconds
+        self.algorithm = algorithm
+        self._hash = PERCEPTUAL_HASHES[algorithm]
+        
+        self._entries = OrderedDict()
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self._hit_distance_sum = 0
+    
+    def image_hash(self, image: Image.Image) -> int:
+        return self._hash(image)
+    
+    def get(self, image_hash: int):
+        """Return (probability vector, Hamming distance) of the closest live entry, or None"""
+        now = time.monotonic()
+        with self._lock:
+            for distance, candidate in self._tree.search(image_hash, self.radius):
+                entry = self._entries.get(candidate)
+                if entry is None or now - entry[0] > self.ttl:
+                    continue
+                self._entries.move_to_end(candidate)
+                self.hits += 1
+                self._hit_distance_sum += distance
+                return entry[1], distance
+            self.misses += 1
+            return None
+    
+    def put(self, image_hash: int, probabilities: np.ndarray):
+        probabilities = np.array(probabilities, dtype=np.float32)
+        probabilities.setflags(write=False)
+        with self._lock:
+            if image_hash not in self._entries:
+                self._tree.add(image_hash)
+            self._entries[image_hash] = (time.monotonic(), probabilities)
+            self._entries.move_to_end(image_hash)
+            
+            if len(self._entries) > self.max_entries:
+                for _ in range(max(1, self.max_entries // 10)):
+                    self._entries.popitem(last=False)
+                self._tree = BKTree(self._entries)
+                self.rebuilds += 1
+    
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': True,
+                'algorithm': self.algorithm,
+                'radius_bits': self.radius,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'mean_hit_distance': round(self._hit_distance_sum / self.hits, 2) if self.hits else 0.0,
+                'tree_rebuilds': self.rebuilds
+            }
+
+# ================= PREDICTION JOBS ================= #
+def check_callback_url(url: str, allowed_hosts=frozenset()):
+    """Raise ValueError unless url is an http(s) URL job results may be POSTed to.
+
+    With an allowlist only those hosts pass; without one every address the host
+    resolves to must be public, so callbacks cannot reach internal services.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise ValueError('callback_url must be an http(s) URL')
+    host = parsed.hostname.lower()
+    
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise ValueError(f'callback_url host {host} is not allowed')
+        return
+    
+    try:
+        addresses = socket.getaddrinfo(host, parsed.port or (443 if parsed.scheme == 'https' else 80),
+                                       proto=socket.IPPROTO_TCP)
+    except socket.gaierror:
+        raise ValueError(f'callback_url host {host} cannot be resolved')
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise ValueError(f'callback_url host {host} resolves to a non-public address')
+
+class _NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """A redirect could point a checked callback URL at an internal address"""
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+CALLBACK_OPENER = urllib.request.build_opener(_NoRedirectHandler)
+
+class JobQueue:
+    """Durable prediction job queue in SQLite, drained by a pool of worker threads.
+
+    Uploads are stored with the job, so queued work survives a restart. A worker
+    claims a job under a lease; if the process dies mid-job the lease expires and
+    another worker (in this or any process sharing the database) picks it up, up
+    to max_attempts times. Finished jobs keep their result for result_ttl seconds.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            image BLOB,
+            filename TEXT,
+            plant_type TEXT,
+            callback_url TEXT,
+            callback_status TEXT,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_until REAL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+    """
+    
+    def __init__(self, db_path: str, handler, num_workers: int = 1, lease_seconds: int = 300,
+                 max_attempts: int = 3, result_ttl: int = 86400, max_pending: int = 0,
+                 poll_interval: float = 1.0, callback_timeout: float = 10.0, callback_retries: int = 3,
+                 callback_hosts=frozenset()):
+        self.db_path = db_path
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.result_ttl = result_ttl
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.callback_timeout = callback_timeout
+        self.callback_retries = max(1, callback_retries)
+        self.callback_hosts = callback_hosts
+        self.logger = logging.getLogger(__name__)
+        
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._callbacks = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._last_purge = 0.0
+        self.completed = 0
+        self.failed = 0
+        self.callbacks_delivered = 0
+        self.callbacks_failed = 0
+        
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(self.SCHEMA)
+        
+        self._threads = []
+    
+    def _connection(self) -> sqlite3.Connection:
+        """One autocommit connection per thread; transactions are opened explicitly"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def start(self):
+        """Start the worker threads and resend callbacks left pending by a previous run"""
+        if self._threads:
+            return
+        self._threads = [
+            threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            for i in range(self.num_workers)
+        ]
+        self._threads.append(threading.Thread(target=self._deliver_callbacks, name='job-callbacks', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        
+        rows = self._connection().execute(
+            "SELECT id FROM jobs WHERE callback_status = 'pending' AND status IN ('done', 'failed')"
+        ).fetchall()
+        for row in rows:
+            self._callbacks.put(row['id'])
+    
+    def pending(self) -> int:
+        row = self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+        ).fetchone()
+        return row[0]
+    
+    def submit(self, data: bytes, filename: str = None, plant_type: str = None, callback_url: str = None) -> str:
+        """Persist a job and return its id; raises queue.Full when max_pending jobs are waiting"""
+        if self.max_pending and self.pending() >= self.max_pending:
+            raise queue.Full(f"Job queue is full ({self.max_pending} pending jobs)")
+        
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO jobs (id, status, image, filename, plant_type, callback_url, callback_status, "
+            "created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, sqlite3.Binary(data), filename, plant_type, callback_url,
+             'pending' if callback_url else None, now, now)
+        )
+        self._wakeup.set()
+        return job_id
+    
+    def get(self, job_id: str) -> dict:
+        """Public view of a job, or None if it does not exist (or has expired)"""
+        row = self._connection().execute(
+            "SELECT id, status, filename, plant_type, callback_url, callback_status, result, error, "
+            "attempts, created_at, updated_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        return self._job_view(row) if row is not None else None
+    
+    @staticmethod
+    def _job_view(row: sqlite3.Row) -> dict:
+        view = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'filename': row['filename'],
+            'plant_type': row['plant_type'],
+            'attempts': row['attempts'],
+            'created_at': datetime.fromtimestamp(row['created_at']).isoformat(),
+            'updated_at': datetime.fromtimestamp(row['updated_at']).isoformat()
+        }
+        if row['callback_url']:
+            view['callback'] = {'url': row['callback_url'], 'status': row['callback_status']}
+        if row['result'] is not None:
+            view['result'] = json.loads(row['result'])
+        if row['error'] is not None:
+            view['error'] = row['error']
+        return view
+    
+    def _claim(self):
+        """Atomically take the oldest queued job (or one whose lease expired), or return None"""
+        conn = self._connection()
+        now = time.time()
+        
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            while True:
+                row = conn.execute(
+                    "SELECT id, image, filename, plant_type, attempts FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+                
+                # A job that keeps killing its worker is given up on
+                if row['attempts'] >= self.max_attempts:
+                    self._finish(conn, row['id'], None, f"Job abandoned after {row['attempts']} attempts")
+                    continue
+                
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    (now + self.lease_seconds, now, row['id'])
+                )
+                conn.execute('COMMIT')
+                return row
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def _finish(self, conn: sqlite3.Connection, job_id: str, result: dict, error: str = None):
+        # The upload is no longer needed once the job has an outcome
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, image = NULL, lease_until = NULL, "
+            "updated_at = ? WHERE id = ?",
+            ('failed' if error else 'done', json.dumps(result) if result is not None else None,
+             error, time.time(), job_id)
+        )
+        with self._stats_lock:
+            if error:
+                self.failed += 1
+            else:
+                self.completed += 1
+    
+    def _purge_expired(self):
+        now = time.time()
+        with self._stats_lock:
+            if now - self._last_purge < 60:
+                return
+            self._last_purge = now
+        self._connection().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ? "
+            "AND (callback_status IS NULL OR callback_status != 'pending')",
+            (now - self.result_ttl,)
+        )
+    
+    def _run(self):
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                self.logger.error(f"Job queue error: {str(e)}")
+                time.sleep(self.poll_interval)
+                continue
+            
+            if row is None:
+                self._purge_expired()
+                # Woken early by submit(); polling picks up jobs from other processes
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            
+            try:
+                result = self.handler(bytes(row['image']), row['filename'], row['plant_type'])
+                error = None if result.get('success') else result.get('error', 'Prediction failed')
+            except Exception as e:
+                self.logger.error(f"Job {row['id']} failed: {str(e)}")
+                result, error = None, str(e)
+            
+            try:
+                self._finish(self._connection(), row['id'], result, error)
+            except sqlite3.Error as e:
+                # Lease expiry will hand the job to another worker
+                self.logger.error(f"Job {row['id']} result could not be stored: {str(e)}")
+                continue
+            
+            self._callbacks.put(row['id'])
+    
+    def _post_callback(self, url: str, payload: dict):
+        # Checked again at delivery: DNS may have changed since the job was submitted
+        check_callback_url(url, self.callback_hosts)
+        body = json.dumps(payload).encode('utf-8')
+        req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'}, method='POST')
+        with CALLBACK_OPENER.open(req, timeout=self.callback_timeout) as response:
+            response.read()
+    
+    def _deliver_callbacks(self):
+        while True:
+            job_id = self._callbacks.get()
+            row = self._connection().execute(
+                "SELECT id, status, filename, plant_type, callback_url, callback_status, result, error, "
+                "attempts, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None or not row['callback_url'] or row['callback_status'] != 'pending':
+                continue
+            
+            payload = self._job_view(row)
+            payload.pop('callback', None)
+            
+            status = 'failed'
+            for attempt in range(self.callback_retries):
+                try:
+                    self._post_callback(row['callback_url'], payload)
+                    status = 'delivered'
+                    break
+                except Exception as e:
+                    self.logger.warning(f"Callback for job {job_id} failed (attempt {attempt + 1}): {str(e)}")
+                    time.sleep(min(2 ** attempt, 30))
+            
+            try:
+                self._connection().execute(
+                    "UPDATE jobs SET callback_status = ? WHERE id = ?", (status, job_id)
+                )
+            except sqlite3.Error as e:
+                self.logger.error(f"Callback status for job {job_id} could not be stored: {str(e)}")
+            
+            with self._stats_lock:
+                if status == 'delivered':
+                    self.callbacks_delivered += 1
+                else:
+                    self.callbacks_failed += 1
+    
+    def stats(self) -> dict:
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        for status, count in self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        with self._stats_lock:
+            return {
+                'enabled': True,
+                'workers': self.num_workers,
+                'max_pending': self.max_pending,
+                'jobs': counts,
+                'completed': self.completed,
+                'failed': self.failed,
+                'callbacks_delivered': self.callbacks_delivered,
+                'callbacks_failed': self.callbacks_failed
+            }
+
 # ================= AI DETECTOR CLASS ================= #
 class PlantDiseaseDetector:
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, pool_size: int = None, num_threads: int = None,
+                 screen_model_path: str = None):
         self.model_path = model_path
-        self.interpreter = None
+        self.pool_size = pool_size or Config.INTERPRETER_POOL_SIZE
+        self.num_threads = num_threads or Config.INTERPRETER_THREADS
+        self.pool = None
         self.input_details = None
         self.output_details = None
         self.logger = logging.getLogger(__name__)
         self._load_model()
+        
+        self.screen_pool = None
+        self.screen_batcher = None
+        # cache/dedup: answered from the prediction cache or near-duplicate index, no model ran
+        self.cascade_counts = {'screen': 0, 'full': 0, 'cache': 0, 'dedup': 0}
+        self._cascade_lock = threading.Lock()
+        self.screen_model_path = Config.SCREEN_MODEL_PATH if screen_model_path is None else screen_model_path
+        if self.screen_model_path:
+            self._load_screen_model(self.screen_model_path)
+        
+        self.batcher = None
+        if Config.MICRO_BATCH_ENABLED:
+            self.batcher = MicroBatcher(
+                self._run_inference,
+                Config.MICRO_BATCH_WINDOW_MS,
+                min(Config.MICRO_BATCH_MAX_SIZE, Config.MAX_BATCH_SIZE),
+                num_workers=self.pool.size
+            )
+            if self.screen_pool is not None:
+                self.screen_batcher = MicroBatcher(
+                    self._run_screen,
+                    Config.MICRO_BATCH_WINDOW_MS,
+                    min(Config.MICRO_BATCH_MAX_SIZE, Config.MAX_BATCH_SIZE),
+                    num_workers=self.screen_pool.size
+                )
+        
+        self.cache = None
+        if Config.PREDICTION_CACHE_SIZE > 0:
+            self.cache = PredictionCache(
+                Config.PREDICTION_CACHE_SIZE,
+                Config.PREDICTION_CACHE_TTL,
+                Config.PREDICTION_CACHE_DIR,
+                Config.PREDICTION_CACHE_DISK_MAX_ENTRIES
+            )
+        
+        self.near_index = None
+        if Config.NEAR_DUPLICATE_ENABLED:
+            self.near_index = NearDuplicateIndex(
+                Config.NEAR_DUPLICATE_MAX_ENTRIES,
+                Config.NEAR_DUPLICATE_RADIUS,
+                Config.PREDICTION_CACHE_TTL,
+                Config.NEAR_DUPLICATE_ALGORITHM
+            )
     
     def _load_model(self):
         """Load TensorFlow Lite model"""
         try:
             # Try multiple possible paths
-            possible_paths = [
-                self.model_path,
-                os.path.join(os.getcwd(), 'InceptionResNetV2_improved.tflite'),
-                os.path.join('/app', 'InceptionResNetV2_improved.tflite'),
-                os.path.join('/app/model', 'InceptionResNetV2_improved.tflite')
-            ]
-            
-            model_found = False
-            for path in possible_paths:
-                if os.path.exists(path):
-                    self.model_path = path
-                    model_found = True
-                    self.logger.info(f"✅ Found model at: {path}")
-                    break
+            self.model_path = resolve_model_path(self.model_path)
+            self.logger.info(f"✅ Found model at: {self.model_path}")
             
-            if not model_found:
-                raise FileNotFoundError(f"❌ Model file not found in any of: {possible_paths}")
+            self.pool = InterpreterPool(self.model_path, self.pool_size, self.num_threads)
             
-            self.interpreter = tf.lite.Interpreter(model_path=self.model_path, num_threads=4)
-            self.interpreter.allocate_tensors()
+            # Cache keys are scoped to this exact model file
+            stat = os.stat(self.model_path)
+            self._model_tag = f"{os.path.abspath(self.model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
             
-            self.input_details = self.interpreter.get_input_details()[0]
-            self.output_details = self.interpreter.get_output_details()[0]
+            # All pooled interpreters share the same dtype and quantization
+            self.input_details = self.pool.input_details
+            self.output_details = self.pool.output_details
+            self._input_quantization = input_quantization(
+                self.input_details['dtype'], self.input_details['quantization']
+            )
             
-            self.logger.info("✅ TensorFlow Lite model loaded successfully")
+            self.logger.info(
+                f"✅ TensorFlow Lite model loaded successfully "
+                f"({self.pool.size} interpreters x {self.pool.num_threads} threads)"
+            )
             
         except Exception as e:
             self.logger.error(f"❌ Failed to load model: {str(e)}")
             raise
     
-    def _preprocess_image(self, image_array: np.ndarray) -> np.ndarray:
-        """Preprocess image for model inference"""
-        if self.input_details['dtype'] == np.float32:
-            return image_array.astype(np.float32) / 255.0
-        
-        scale, zero_point = self.input_details['quantization']
-        return ((image_array / 255.0) / scale + zero_point).astype(self.input_details['dtype'])
+    def _load_screen_model(self, model_path: str):
+        """Load the first-stage screen model; it must predict the same classes as the main model"""
+        try:
+            self.screen_pool = InterpreterPool(model_path, self.pool_size, Config.SCREEN_INTERPRETER_THREADS)
+            
+            num_outputs = int(self.screen_pool.output_details['shape'][-1])
+            if num_outputs != NUM_CLASSES:
+                raise ValueError(f"Screen model has {num_outputs} outputs, expected {NUM_CLASSES}")
+            
+            # Preprocessing matches the main model (same rescaling), only the input size may differ
+            self._screen_quantization = input_quantization(
+                self.screen_pool.input_details['dtype'], self.screen_pool.input_details['quantization']
+            )
+            self._screen_size = tuple(int(d) for d in self.screen_pool.input_details['shape'][1:3])
+            
+            self.logger.info(
+                f"✅ Screen model loaded from {model_path} "
+                f"(threshold {Config.SCREEN_CONFIDENCE_THRESHOLD}, input {self._screen_size})"
+            )
+        except Exception as e:
+            self.logger.error(f"❌ Failed to load screen model: {str(e)}")
+            raise
     
-    def _postprocess_output(self, output_tensor: np.ndarray) -> np.ndarray:
+    def _postprocess_output(self, output_tensor: np.ndarray, output_details: dict) -> np.ndarray:
         """Postprocess model output"""
-        if self.output_details['dtype'] == np.float32:
+        if output_details['dtype'] == np.float32:
             return output_tensor
         
-        scale, zero_point = self.output_details['quantization']
+        scale, zero_point = output_details['quantization']
         return (output_tensor.astype(np.float32) - zero_point) * scale
     
     def _get_plant_prefix(self, plant_name: str = None) -> str:
@@ -232,104 +1699,810 @@ class PlantDiseaseDetector:
         normalized_name = normalize_text(plant_name)
         return PLANT_ALIAS.get(normalized_name, None)
     
-    def predict(self, image_path: str, plant_type: str = None) -> dict:
-        """Predict plant disease from image"""
-        try:
-            start_time = datetime.now()
-            
-            # Load and preprocess image
-            image = load_img(image_path, target_size=(Config.IMG_SIZE, Config.IMG_SIZE))
-            image_array = img_to_array(image)
-            processed_image = self._preprocess_image(image_array)
-            
-            # Run inference
-            self.interpreter.set_tensor(self.input_details['index'], np.expand_dims(processed_image, 0))
-            self.interpreter.invoke()
-            
-            # Get and postprocess output
-            output = self.interpreter.get_tensor(self.output_details['index'])[0]
-            probabilities = self._postprocess_output(output)
-            
-            # Filter by plant type if specified
-            plant_prefix = self._get_plant_prefix(plant_type)
-            if plant_prefix:
-                filtered_indices = [
-                    i for i, class_name in enumerate(ALL_CLASSES)
-                    if class_name.startswith(plant_prefix + "___")
-                ]
-                
-                if not filtered_indices:
-                    raise ValueError(f"No classes found for plant type: {plant_type}")
-                
-                filtered_probs = probabilities[filtered_indices]
-                filtered_probs = filtered_probs / filtered_probs.sum()
-                
-                best_local_idx = int(np.argmax(filtered_probs))
-                best_idx = filtered_indices[best_local_idx]
-                confidence = float(filtered_probs[best_local_idx])
+    def _load_image_array(self, image) -> np.ndarray:
+        """Load an image (file path, decoded PIL image or image_to_array output) as a (IMG_SIZE, IMG_SIZE, 3) uint8 array"""
+        if isinstance(image, np.ndarray):
+            return image
+        if not isinstance(image, Image.Image):
+            image = open_image_rgb(image)
+        return image_to_array(image)
+    
+    def _invoke(self, handle: PooledInterpreter, image_arrays: list, quantization: tuple = None,
+                stage: str = 'invoke') -> np.ndarray:
+        """Run one invoke on an interpreter the caller holds exclusively.
+        
+        The batch is padded up to padded_batch_size(); padding rows hold the previous
+        invoke's inputs (zeros after a resize) and their outputs are dropped.
+        """
+        count = len(image_arrays)
+        resized = handle.ensure_batch_size(padded_batch_size(count))
+        
+        # The view must be released before invoke()
+        input_view = handle.interpreter.tensor(handle.input_details['index'])()
+        fill_input_tensor(input_view, image_arrays, quantization)
+        if resized:
+            input_view[count:] = 0
+        del input_view
+        
+        stage_start = time.perf_counter()
+        handle.interpreter.invoke()
+        observe_stage(stage, time.perf_counter() - stage_start)
+        output = handle.interpreter.get_tensor(handle.output_details['index'])[:count]
+        
+        return self._postprocess_output(output, handle.output_details)
+    
+    def _run_inference(self, image_arrays: list) -> np.ndarray:
+        """Run one interpreter invoke over a batch of images, returns (N, classes) probabilities"""
+        with self.pool.checkout() as handle:
+            return self._invoke(handle, image_arrays, self._input_quantization)
+    
+    def _run_screen(self, image_arrays: list) -> np.ndarray:
+        """Score a batch with the screen model, resizing when its input is not IMG_SIZE"""
+        if self._screen_size != (Config.IMG_SIZE, Config.IMG_SIZE):
+            height, width = self._screen_size
+            image_arrays = [
+                np.asarray(Image.fromarray(arr).resize((width, height), Image.NEAREST)) for arr in image_arrays
+            ]
+        with self.screen_pool.checkout() as handle:
+            return self._invoke(handle, image_arrays, self._screen_quantization, stage='screen_invoke')
+    
+    def _screen_confidence(self, probabilities: np.ndarray, plant_type: str = None) -> float:
+        """Screen model's top confidence after the plant filter, compared against the threshold"""
+        probs, _, _ = self._filter_probabilities(probabilities, plant_type)
+        return float(probs.max())
+    
+    def _count_stage(self, stage: str, amount: int = 1):
+        with self._cascade_lock:
+            self.cascade_counts[stage] += amount
+        CASCADE_ANSWERS.inc(amount, stage=stage)
+    
+    def _cascade_info(self, stage: str, screen_confidence: float = None) -> dict:
+        return {
+            'stage': stage,
+            'screen_confidence': screen_confidence,
+            'threshold': Config.SCREEN_CONFIDENCE_THRESHOLD
+        }
+    
+    def _infer_single(self, image_array: np.ndarray) -> np.ndarray:
+        """Run inference for one image, through the micro-batcher when enabled"""
+        if self.batcher is not None:
+            return self.batcher.submit(image_array)
+        return self._run_inference([image_array])[0]
+    
+    def _filter_probabilities(self, probabilities: np.ndarray, plant_type: str = None) -> tuple:
+        """Restrict to the plant's classes. Returns (probs, class indices or None, plant prefix)"""
+        plant_prefix = self._get_plant_prefix(plant_type)
+        if not plant_prefix:
+            return probabilities, None, None
+        
+        class_indices = PLANT_CLASS_INDICES.get(plant_prefix)
+        if class_indices is None:
+            raise ValueError(f"No classes found for plant type: {plant_type}")
+        
+        # Renormalize over this plant's classes only
+        probs = probabilities[class_indices]
+        return probs / probs.sum(), class_indices, plant_prefix
+    
+    def _build_result(self, probabilities: np.ndarray, plant_type: str = None,
+                      processing_time: float = 0.0, top_k: int = None, compact: bool = False) -> dict:
+        """Build the prediction response from one probability vector.
+
+        compact=True returns class indices into /classes and columnar top-k
+        arrays instead of repeating class names.
+        """
+        # Filter by plant type if specified
+        probs, class_indices, plant_prefix = self._filter_probabilities(probabilities, plant_type)
+        
+        # Top-k without sorting every class
+        k = min(top_k or Config.TOP_K_PREDICTIONS, len(probs))
+        top_local = np.argpartition(-probs, k - 1)[:k]
+        top_local = top_local[np.argsort(-probs[top_local], kind='stable')]
+        top_classes = class_indices[top_local] if class_indices is not None else top_local
+        
+        best_idx = int(top_classes[0])
+        confidence = float(probs[top_local[0]])
+        
+        if compact:
+            return {
+                'success': True,
+                'prediction': {'class_index': best_idx, 'confidence': confidence},
+                'top_k': {'class_index': top_classes.tolist(), 'confidence': probs[top_local].tolist()},
+                'plant_prefix': plant_prefix,
+                'filtered_classes': len(probs),
+                'processing_time': round(processing_time, 3)
+            }
+        
+        all_predictions = [
+            {
+                'class_en': ALL_CLASSES[idx],
+                'class_vi': CLASS_NAMES_VI[idx],
+                'confidence': float(prob),
+                'confidence_percent': float(prob * 100)
+            }
+            for idx, prob in zip(top_classes.tolist(), probs[top_local].tolist())
+        ]
+        
+        return {
+            'success': True,
+            'prediction': {
+                'class_en': ALL_CLASSES[best_idx],
+                'class_vi': CLASS_NAMES_VI[best_idx],
+                'confidence': confidence,
+                'confidence_percent': confidence * 100
+            },
+            'plant_filter': {
+                'applied': plant_type is not None,
+                'plant_type': plant_type,
+                'plant_prefix': plant_prefix
+            },
+            'all_predictions': all_predictions,
+            'total_classes': NUM_CLASSES,
+            'filtered_classes': len(probs),
+            'processing_time': round(processing_time, 3),
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    @staticmethod
+    def _near_duplicate_info(image_hash: int, distance: int = None) -> dict:
+        return {'hit': distance is not None, 'distance': distance, 'hash': f"{image_hash:016x}"}
+    
+    def cache_key(self, content_digest: bytes) -> str:
+        """Prediction cache key for an image's PredictionCache.content_digest, or None when caching is disabled"""
+        if self.cache is None:
+            return None
+        return PredictionCache.make_key(content_digest, self._model_tag)
+    
+    def _cache_get(self, cache_key: str):
+        if self.cache is None or cache_key is None:
+            return None
+        return self.cache.get(cache_key)
+    
+    def _cache_put(self, cache_key: str, probabilities: np.ndarray):
+        if self.cache is not None and cache_key is not None:
+            self.cache.put(cache_key, probabilities)
+    
+    def predict(self, image, plant_type: str = None, cache_key: str = None,
+                top_k: int = None, compact: bool = False) -> dict:
+        """Predict plant disease from an image path or decoded PIL image"""
+        try:
+            start_time = time.perf_counter()
+            timings = {}
+            
+            probabilities = self._cache_get(cache_key)
+            cached = probabilities is not None
+            answered_by = 'cache' if cached else 'full'
+            screen_confidence = None
+            image_hash = None
+            near_distance = None
+            
+            # Near-duplicate lookup on the decoded image, before any model runs
+            if not cached and self.near_index is not None:
+                stage_start = time.perf_counter()
+                if not isinstance(image, Image.Image):
+                    image = open_image_rgb(image)
+                image_hash = self.near_index.image_hash(image)
+                near = self.near_index.get(image_hash)
+                timings['near_duplicate'] = time.perf_counter() - stage_start
+                if near is not None:
+                    probabilities, near_distance = near
+                    answered_by = 'dedup'
+                    self._cache_put(cache_key, probabilities)
+            
+            if probabilities is None:
+                # Load image and run inference
+                stage_start = time.perf_counter()
+                image_array = self._load_image_array(image)
+                timings['preprocess'] = time.perf_counter() - stage_start
                 
-                all_predictions = [
-                    {
-                        'class_en': ALL_CLASSES[idx],
-                        'class_vi': VIET_NAMES.get(ALL_CLASSES[idx], ALL_CLASSES[idx]),
-                        'confidence': float(filtered_probs[i]),
-                        'confidence_percent': float(filtered_probs[i] * 100)
-                    }
-                    for i, idx in enumerate(filtered_indices)
-                ]
-            else:
-                best_idx = int(np.argmax(probabilities))
-                confidence = float(probabilities[best_idx])
+                # Cascade: let the screen model answer when it is confident enough
+                if self.screen_pool is not None:
+                    stage_start = time.perf_counter()
+                    if self.screen_batcher is not None:
+                        screen_probabilities = self.screen_batcher.submit(image_array)
+                    else:
+                        screen_probabilities = self._run_screen([image_array])[0]
+                    timings['screen'] = time.perf_counter() - stage_start
+                    
+                    screen_confidence = self._screen_confidence(screen_probabilities, plant_type)
+                    if screen_confidence >= Config.SCREEN_CONFIDENCE_THRESHOLD:
+                        probabilities = screen_probabilities
+                        answered_by = 'screen'
                 
-                all_predictions = [
-                    {
-                        'class_en': class_name,
-                        'class_vi': VIET_NAMES.get(class_name, class_name),
-                        'confidence': float(prob),
-                        'confidence_percent': float(prob * 100)
-                    }
-                    for class_name, prob in zip(ALL_CLASSES, probabilities)
-                ]
-            
-            # Sort predictions by confidence
-            all_predictions.sort(key=lambda x: x['confidence'], reverse=True)
+                # Only main-model outputs are cached
+                if probabilities is None:
+                    stage_start = time.perf_counter()
+                    probabilities = self._infer_single(image_array)
+                    timings['inference'] = time.perf_counter() - stage_start
+                    self._cache_put(cache_key, probabilities)
+                    if image_hash is not None:
+                        self.near_index.put(image_hash, probabilities)
             
             # Calculate processing time
-            processing_time = (datetime.now() - start_time).total_seconds()
+            processing_time = time.perf_counter() - start_time
             
-            result = {
-                'success': True,
-                'prediction': {
-                    'class_en': ALL_CLASSES[best_idx],
-                    'class_vi': VIET_NAMES.get(ALL_CLASSES[best_idx], ALL_CLASSES[best_idx]),
-                    'confidence': confidence,
-                    'confidence_percent': confidence * 100
-                },
-                'plant_filter': {
-                    'applied': plant_type is not None,
-                    'plant_type': plant_type,
-                    'plant_prefix': plant_prefix
-                },
-                'all_predictions': all_predictions[:10],
-                'total_classes': len(ALL_CLASSES),
-                'filtered_classes': len(filtered_indices) if plant_prefix else len(ALL_CLASSES),
-                'processing_time': round(processing_time, 3),
-                'timestamp': datetime.now().isoformat()
-            }
+            stage_start = time.perf_counter()
+            result = self._build_result(probabilities, plant_type, processing_time, top_k, compact)
+            timings['postprocess'] = time.perf_counter() - stage_start
             
+            for stage, seconds in timings.items():
+                observe_stage(stage, seconds)
+            
+            result['cached'] = cached
+            if image_hash is not None:
+                result['near_duplicate'] = self._near_duplicate_info(image_hash, near_distance)
+            if self.screen_pool is not None:
+                self._count_stage(answered_by)
+                result['cascade'] = self._cascade_info(answered_by, screen_confidence)
+            result['timings_ms'] = {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
             return result
             
         except Exception as e:
             self.logger.error(f"Prediction error: {str(e)}")
+            ERRORS.inc(type=type(e).__name__)
             return {
                 'success': False,
                 'error': str(e),
                 'timestamp': datetime.now().isoformat()
             }
+    
+    def predict_batch(self, images: list, plant_types: list = None, cache_keys: list = None,
+                      top_k: int = None, compact: bool = False, perceptual_hashes: list = None) -> list:
+        """Predict plant diseases for many images, one interpreter invoke per chunk of MAX_BATCH_SIZE.
+        
+        images may already be image_to_array outputs; their near-duplicate hashes then come
+        from perceptual_hashes, computed before the decoded image was dropped.
+        """
+        plant_types = plant_types or [None] * len(images)
+        cache_keys = cache_keys or [None] * len(images)
+        perceptual_hashes = perceptual_hashes or [None] * len(images)
+        results = [None] * len(images)
+        
+        # Load images first so one unreadable file does not fail the whole batch
+        loaded = []
+        image_hashes = {}
+        for i, image in enumerate(images):
+            try:
+                probabilities = self._cache_get(cache_keys[i])
+                if probabilities is not None:
+                    results[i] = self._build_result(probabilities, plant_types[i], 0.0, top_k, compact)
+                    results[i]['cached'] = True
+                    if self.screen_pool is not None:
+                        self._count_stage('cache')
+                        results[i]['cascade'] = self._cascade_info('cache')
+                    continue
+                
+                if self.near_index is not None:
+                    image_hash = perceptual_hashes[i]
+                    if image_hash is None:
+                        if not isinstance(image, Image.Image):
+                            image = open_image_rgb(image)
+                        image_hash = self.near_index.image_hash(image)
+                    near = self.near_index.get(image_hash)
+                    if near is not None:
+                        probabilities, distance = near
+                        self._cache_put(cache_keys[i], probabilities)
+                        results[i] = self._build_result(probabilities, plant_types[i], 0.0, top_k, compact)
+                        results[i]['cached'] = False
+                        results[i]['near_duplicate'] = self._near_duplicate_info(image_hash, distance)
+                        if self.screen_pool is not None:
+                            self._count_stage('dedup')
+                            results[i]['cascade'] = self._cascade_info('dedup')
+                        continue
+                    image_hashes[i] = image_hash
+                
+                loaded.append((i, self._load_image_array(image)))
+            except Exception as e:
+                self.logger.error(f"Batch image load error: {str(e)}")
+                results[i] = {
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }
+        
+        for start in range(0, len(loaded), Config.MAX_BATCH_SIZE):
+            chunk = loaded[start:start + Config.MAX_BATCH_SIZE]
+            start_time = time.perf_counter()
+            
+            try:
+                # Cascade: the screen model scores the whole chunk, the main model
+                # only sees the rows it was unsure about
+                screened = {}
+                if self.screen_pool is not None:
+                    screen_probabilities = self._run_screen([arr for _, arr in chunk])
+                    for row, (i, _) in enumerate(chunk):
+                        confidence = self._screen_confidence(screen_probabilities[row], plant_types[i])
+                        screened[i] = (confidence, screen_probabilities[row])
+                    
+                    full_chunk = [
+                        (i, arr) for i, arr in chunk
+                        if screened[i][0] < Config.SCREEN_CONFIDENCE_THRESHOLD
+                    ]
+                else:
+                    full_chunk = chunk
+                
+                full_rows = {}
+                if full_chunk:
+                    probabilities = self._run_inference([arr for _, arr in full_chunk])
+                    full_rows = {i: probabilities[row] for row, (i, _) in enumerate(full_chunk)}
+            except Exception as e:
+                self.logger.error(f"Batch prediction error: {str(e)}")
+                ERRORS.inc(len(chunk), type=type(e).__name__)
+                for i, _ in chunk:
+                    results[i] = {
+                        'success': False,
+                        'error': str(e),
+                        'timestamp': datetime.now().isoformat()
+                    }
+                continue
+            
+            # Inference time is shared by the chunk, report it per image
+            processing_time = (time.perf_counter() - start_time) / len(chunk)
+            
+            if screened:
+                self._count_stage('screen', len(chunk) - len(full_chunk))
+                self._count_stage('full', len(full_chunk))
+            
+            for i, _ in chunk:
+                if i in full_rows:
+                    probabilities, answered_by = full_rows[i], 'full'
+                    self._cache_put(cache_keys[i], probabilities)
+                    if i in image_hashes:
+                        self.near_index.put(image_hashes[i], probabilities)
+                else:
+                    probabilities, answered_by = screened[i][1], 'screen'
+                try:
+                    results[i] = self._build_result(
+                        probabilities, plant_types[i], processing_time, top_k, compact
+                    )
+                    results[i]['cached'] = False
+                    if i in image_hashes:
+                        results[i]['near_duplicate'] = self._near_duplicate_info(image_hashes[i])
+                    if screened:
+                        results[i]['cascade'] = self._cascade_info(answered_by, screened[i][0])
+                except Exception as e:
+                    self.logger.error(f"Prediction error: {str(e)}")
+                    results[i] = {
+                        'success': False,
+                        'error': str(e),
+                        'timestamp': datetime.now().isoformat()
+                    }
+        
+        return results
+    
+    def warmup(self):
+        """Run one inference on every pooled interpreter; raises if the model cannot serve.
+        
+        Every interpreter is checked out of its pool first (all at once, so each one
+        is warmed exactly once): job workers or requests may already be running.
+        """
+        blank = np.zeros((Config.IMG_SIZE, Config.IMG_SIZE, 3), dtype=np.uint8)
+        with ExitStack() as stack:
+            handles = [stack.enter_context(self.pool.checkout()) for _ in range(self.pool.size)]
+            for handle in handles:
+                probabilities = self._invoke(handle, [blank], self._input_quantization)
+                if probabilities.shape != (1, NUM_CLASSES) or not np.all(np.isfinite(probabilities)):
+                    raise RuntimeError(f"Model warm-up produced unexpected output {probabilities.shape}")
+        
+        if self.screen_pool is not None:
+            screen_blank = np.zeros((*self._screen_size, 3), dtype=np.uint8)
+            with ExitStack() as stack:
+                handles = [stack.enter_context(self.screen_pool.checkout()) for _ in range(self.screen_pool.size)]
+                for handle in handles:
+                    probabilities = self._invoke(handle, [screen_blank], self._screen_quantization, stage='screen_invoke')
+                    if probabilities.shape != (1, NUM_CLASSES) or not np.all(np.isfinite(probabilities)):
+                        raise RuntimeError(f"Screen model warm-up produced unexpected output {probabilities.shape}")
+    
+    def close(self):
+        """Stop the micro-batch workers; only call once no request can still use this detector"""
+        for batcher in (self.batcher, self.screen_batcher):
+            if batcher is not None:
+                batcher.close()
+    
+    def cascade_stats(self) -> dict:
+        if self.screen_pool is None:
+            return {'enabled': False}
+        with self._cascade_lock:
+            counts = dict(self.cascade_counts)
+        total = counts['screen'] + counts['full']
+        return {
+            'enabled': True,
+            'screen_model_path': self.screen_model_path,
+            'threshold': Config.SCREEN_CONFIDENCE_THRESHOLD,
+            'answered': counts,
+            # Share of model-answered predictions the screen model handled; cache/dedup hits ran no model
+            'screen_rate': round(counts['screen'] / total, 4) if total else 0.0,
+            'screen_pool': self.screen_pool.stats()
+        }
+
+# ================= MODEL REGISTRY ================= #
+def top_class_name(result: dict) -> str:
+    """Top-1 class name of a full or compact prediction result"""
+    prediction = result['prediction']
+    return prediction['class_en'] if 'class_en' in prediction else ALL_CLASSES[prediction['class_index']]
+
+def load_model_specs(path: str) -> list:
+    """Read the model registry file; without one, serve TFLITE_PATH as the single 'default' model.
+
+    File format:
+        {"models": [
+            {"name": "inception", "version": "float32", "path": "./a.tflite", "weight": 90},
+            {"name": "inception", "version": "int8", "path": "./b.tflite", "weight": 10},
+            {"name": "inception", "version": "int8-next", "path": "./c.tflite", "shadow": true}
+        ]}
+    Optional per model: pool_size, threads, screen_model_path. Shadow models get no
+    traffic; they re-run a sample of served requests to measure agreement.
+    """
+    if not path or not os.path.exists(path):
+        return [{'id': 'default:1', 'name': 'default', 'version': '1', 'path': Config.TFLITE_PATH,
+                 'weight': 1.0, 'shadow': False}]
+    
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f).get('models', [])
+    
+    specs = []
+    for entry in entries:
+        if not entry.get('name') or not entry.get('path'):
+            raise ValueError(f"Model registry entry needs a name and a path: {entry}")
+        spec = dict(entry)
+        spec['version'] = str(entry.get('version', '1'))
+        spec['id'] = f"{spec['name']}:{spec['version']}"
+        spec['shadow'] = bool(entry.get('shadow', False))
+        spec['weight'] = 0.0 if spec['shadow'] else float(entry.get('weight', 1.0))
+        if spec['weight'] < 0:
+            raise ValueError(f"Model {spec['id']} has a negative weight")
+        specs.append(spec)
+    
+    if not specs:
+        raise ValueError(f"Model registry {path} lists no models")
+    if len({spec['id'] for spec in specs}) != len(specs):
+        raise ValueError(f"Model registry {path} lists a model id twice")
+    if all(spec['shadow'] for spec in specs):
+        raise ValueError(f"Model registry {path} has only shadow models, none would serve traffic")
+    return specs
+
+# Spec keys baked into a detector when it is built; changing any of them needs new interpreters
+REBUILD_SPEC_KEYS = ('path', 'pool_size', 'threads', 'screen_model_path')
+
+def model_file_signature(path: str) -> tuple:
+    """(size, mtime) of a model file; a change means it was replaced on disk"""
+    stat = os.stat(resolve_model_path(path))
+    return stat.st_size, stat.st_mtime_ns
+
+class ModelVersion:
+    """One loaded model plus its usage counters and the number of requests using it"""
+    
+    def __init__(self, spec: dict, detector: PlantDiseaseDetector):
+        self.spec = spec
+        self.id = spec['id']
+        self.detector = detector
+        self.signature = model_file_signature(spec['path'])
+        self.loaded_at = datetime.now().isoformat()
+        
+        self._lock = threading.Lock()
+        self.active = 0
+        self.retired = False
+        self.images = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+    
+    def record(self, seconds: float, images: int, errors: int):
+        with self._lock:
+            self.images += images
+            self.errors += errors
+            self.total_seconds += seconds
+        MODEL_IMAGES.inc(images, model=self.id)
+        MODEL_LATENCY.observe(seconds, model=self.id)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'name': self.spec['name'],
+                'version': self.spec['version'],
+                'path': self.detector.model_path,
+                'weight': self.spec['weight'],
+                'shadow': self.spec['shadow'],
+                'loaded_at': self.loaded_at,
+                'active_requests': self.active,
+                'images': self.images,
+                'errors': self.errors,
+                'avg_latency_ms': round(self.total_seconds * 1000 / self.images, 3) if self.images else 0.0,
+                'quantized': self.detector.input_details['dtype'] != np.float32
+            }
+
+class ModelRegistry:
+    """Named, versioned models with weighted traffic split, shadow comparison and hot reload.
+
+    A reload builds and warms the replacement first, then swaps it in under the
+    lock. Requests already running keep their reference; the old version is
+    closed once the last of them finishes, so no request is dropped.
+    """
+    
+    def __init__(self, registry_file: str, shadow_sample_rate: float = 0.0, detector_factory=None):
+        self.registry_file = registry_file
+        self.shadow_sample_rate = shadow_sample_rate
+        self.detector_factory = detector_factory or self._build_detector
+        self.logger = logging.getLogger(__name__)
+        
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._models = {}
+        self.last_reload = None
+        self.last_reload_error = None
+        
+        self._agreement = {}
+        self._shadow_pending = 0
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-shadow')
+        
+        for spec in load_model_specs(registry_file):
+            self._models[spec['id']] = ModelVersion(spec, self.detector_factory(spec))
+        self.default_id = self._first_served_id()
+    
+    @staticmethod
+    def _build_detector(spec: dict) -> PlantDiseaseDetector:
+        return PlantDiseaseDetector(
+            spec['path'],
+            pool_size=spec.get('pool_size'),
+            num_threads=spec.get('threads'),
+            screen_model_path=spec.get('screen_model_path', Config.SCREEN_MODEL_PATH)
+        )
+    
+    def _first_served_id(self) -> str:
+        served = [model_id for model_id, version in self._models.items() if not version.spec['shadow']]
+        return (served or list(self._models))[0]
+    
+    @property
+    def default(self) -> ModelVersion:
+        with self._lock:
+            return self._models.get(self.default_id) or next(iter(self._models.values()))
+    
+    def knows(self, model: str) -> bool:
+        with self._lock:
+            return model in self._models or any(v.spec['name'] == model for v in self._models.values())
+    
+    def _select(self, model: str = None) -> ModelVersion:
+        """Exact id, else weighted pick among a name's versions, else among every served model"""
+        if model in self._models:
+            return self._models[model]
+        
+        if model:
+            candidates = [v for v in self._models.values() if v.spec['name'] == model]
+            if not candidates:
+                raise KeyError(f"Unknown model: {model}")
+        else:
+            candidates = [v for v in self._models.values() if not v.spec['shadow']]
+            if not candidates:
+                raise KeyError("No model serves traffic: every registered version is a shadow")
+        
+        weights = [v.spec['weight'] for v in candidates]
+        if not any(weights):
+            return candidates[0]
+        return random.choices(candidates, weights=weights)[0]
+    
+    @contextmanager
+    def use(self, model: str = None):
+        """Hold a model version for the duration of the with-block"""
+        with self._lock:
+            version = self._select(model)
+            with version._lock:
+                version.active += 1
+        try:
+            yield version
+        finally:
+            with version._lock:
+                version.active -= 1
+                drained = version.retired and version.active == 0
+            if drained:
+                self._close(version)
+    
+    def _close(self, version: ModelVersion):
+        self.logger.info(f"Closing retired model {version.id}")
+        version.detector.close()
+    
+    def _retire(self, version: ModelVersion):
+        with version._lock:
+            version.retired = True
+            drained = version.active == 0
+        if drained:
+            self._close(version)
+    
+    def predict(self, image, plant_type: str = None, data: bytes = None, model: str = None,
+                top_k: int = None, compact: bool = False) -> dict:
+        """Predict with the requested model (or the traffic split), recording per-model usage"""
+        with self.use(model) as version:
+            start_time = time.perf_counter()
+            cache_key = version.detector.cache_key(PredictionCache.content_digest(data)) if data is not None else None
+            result = version.detector.predict(image, plant_type, cache_key, top_k, compact)
+            version.record(time.perf_counter() - start_time, 1, 0 if result.get('success') else 1)
+        
+        result['model'] = {'id': version.id, 'name': version.spec['name'], 'version': version.spec['version']}
+        if result.get('success'):
+            self._maybe_shadow(version.id, result, image, plant_type)
+        return result
+    
+    def predict_batch(self, images: list, plant_types: list = None, digests: list = None, model: str = None,
+                      top_k: int = None, compact: bool = False, image_hashes: list = None) -> list:
+        """Batched predict on one model version for the whole request (digests: PredictionCache.content_digest)"""
+        with self.use(model) as version:
+            start_time = time.perf_counter()
+            cache_keys = [version.detector.cache_key(digest) for digest in digests] if digests else None
+            results = version.detector.predict_batch(images, plant_types, cache_keys, top_k, compact, image_hashes)
+            errors = sum(1 for result in results if not result.get('success'))
+            version.record(time.perf_counter() - start_time, len(results), errors)
+        
+        model_info = {'id': version.id, 'name': version.spec['name'], 'version': version.spec['version']}
+        for result in results:
+            result['model'] = model_info
+        return results
+    
+    def _maybe_shadow(self, served_id: str, served: dict, image, plant_type: str):
+        """Re-run a sample of served requests on each shadow model, off the request path (uncached)"""
+        if self.shadow_sample_rate <= 0 or random.random() >= self.shadow_sample_rate:
+            return
+        with self._lock:
+            shadows = [model_id for model_id, v in self._models.items() if v.spec['shadow']]
+            # Bounded backlog: shadow work is dropped rather than queued without limit
+            if not shadows or self._shadow_pending >= 64:
+                return
+            self._shadow_pending += 1
+        self._shadow_executor.submit(self._run_shadow, served_id, served, shadows, image, plant_type)
+    
+    def _run_shadow(self, served_id: str, served: dict, shadows: list, image, plant_type: str):
+        try:
+            for shadow_id in shadows:
+                try:
+                    with self.use(shadow_id) as version:
+                        start_time = time.perf_counter()
+                        result = version.detector.predict(image, plant_type)
+                        seconds = time.perf_counter() - start_time
+                        version.record(seconds, 1, 0 if result.get('success') else 1)
+                except KeyError:
+                    continue
+                if not result.get('success'):
+                    continue
+                
+                agreed = result['prediction']['class_en'] == top_class_name(served)
+                with self._lock:
+                    pair = self._agreement.setdefault(f"{served_id}->{shadow_id}", {
+                        'compared': 0, 'agreed': 0, 'confidence_delta_sum': 0.0
+                    })
+                    pair['compared'] += 1
+                    pair['agreed'] += int(agreed)
+                    pair['confidence_delta_sum'] += abs(
+                        result['prediction']['confidence'] - served['prediction']['confidence']
+                    )
+                MODEL_SHADOW_COMPARISONS.inc(served=served_id, shadow=shadow_id, agreed=str(agreed).lower())
+        except Exception as e:
+            self.logger.warning(f"Shadow comparison failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._shadow_pending -= 1
+    
+    def reload(self, model: str = None) -> dict:
+        """Re-read the registry file and (re)load models that were added, changed on disk,
+        or given a new path, pool_size, threads or screen_model_path.
+
+        With model set, only that id is reloaded, even if its file is unchanged.
+        A model that fails to load keeps serving its previous version.
+        """
+        with self._reload_lock:
+            specs = {spec['id']: spec for spec in load_model_specs(self.registry_file)}
+            if model is not None and model not in specs:
+                raise KeyError(f"Unknown model: {model}")
+            
+            with self._lock:
+                current = dict(self._models)
+            
+            loaded, failed, removed = [], {}, []
+            for model_id, spec in specs.items():
+                if model is not None and model_id != model:
+                    continue
+                old = current.get(model_id)
+                if old is not None and model is None:
+                    try:
+                        unchanged = (old.signature == model_file_signature(spec['path'])
+                                     and all(old.spec.get(key) == spec.get(key) for key in REBUILD_SPEC_KEYS))
+                    except OSError as e:
+                        failed[model_id] = str(e)
+                        continue
+                    if unchanged:
+                        # Weight/shadow changes need no new interpreters
+                        old.spec = {**spec}
+                        continue
+                
+                try:
+                    detector = self.detector_factory(spec)
+                    detector.warmup()
+                    current[model_id] = ModelVersion(spec, detector)
+                    loaded.append(model_id)
+                except Exception as e:
+                    self.logger.error(f"❌ Reload of model {model_id} failed: {str(e)}")
+                    failed[model_id] = str(e)
+            
+            if model is None:
+                removed = [model_id for model_id in current if model_id not in specs]
+            
+            with self._lock:
+                previous, self._models = self._models, {
+                    model_id: version for model_id, version in current.items() if model_id not in removed
+                }
+                self.default_id = self._first_served_id()
+            
+            # Retire replaced or removed versions once their in-flight requests finish
+            for model_id, version in previous.items():
+                if self._models.get(model_id) is not version:
+                    self._retire(version)
+            
+            self.last_reload = datetime.now().isoformat()
+            self.last_reload_error = failed or None
+            if loaded or removed:
+                self.logger.info(f"✅ Model registry reloaded (loaded: {loaded}, removed: {removed})")
+            return {'loaded': loaded, 'removed': removed, 'failed': failed}
+    
+    def start_watcher(self, interval: float):
+        """Poll the registry file and model files, reloading whatever changed"""
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception as e:
+                    self.logger.error(f"Model registry reload failed: {str(e)}")
+        
+        threading.Thread(target=watch, name='model-registry-watcher', daemon=True).start()
+    
+    def versions(self) -> list:
+        with self._lock:
+            return list(self._models.values())
+    
+    def warmup(self):
+        for version in self.versions():
+            version.detector.warmup()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            models = dict(self._models)
+            agreement = {
+                pair: {
+                    'compared': counts['compared'],
+                    'agreed': counts['agreed'],
+                    'agreement_rate': round(counts['agreed'] / counts['compared'], 4),
+                    'mean_confidence_delta': round(counts['confidence_delta_sum'] / counts['compared'], 4)
+                }
+                for pair, counts in self._agreement.items() if counts['compared']
+            }
+        return {
+            'registry_file': self.registry_file if os.path.exists(self.registry_file) else None,
+            'default': self.default_id,
+            'shadow_sample_rate': self.shadow_sample_rate,
+            'last_reload': self.last_reload,
+            'last_reload_error': self.last_reload_error,
+            'models': {model_id: version.stats() for model_id, version in models.items()},
+            'agreement': agreement
+        }
 
 # ================= FLASK APPLICATION ================= #
+class InMemoryRequest(Request):
+    """Keep multipart uploads in memory instead of spooling large files to disk.
+
+    MAX_CONTENT_LENGTH already bounds the request size, so the upload can be
+    decoded straight from this buffer.
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+def load_msgpack():
+    """msgpack is optional; without it MessagePack responses are refused with 406"""
+    try:
+        return importlib.import_module('msgpack')
+    except ImportError:
+        return None
+
 def create_app():
     app = Flask(__name__)
+    app.request_class = InMemoryRequest
     app.config.from_object(Config)
     
     # Enable CORS
@@ -342,25 +2515,319 @@ def create_app():
     os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
     os.makedirs('templates', exist_ok=True)
     
-    # Initialize AI detector
+    # Initialize AI models
     try:
-        detector = PlantDiseaseDetector(Config.TFLITE_PATH)
+        registry = ModelRegistry(Config.MODEL_REGISTRY_FILE, Config.SHADOW_SAMPLE_RATE)
     except Exception as e:
         app.logger.error(f"Failed to initialize detector: {str(e)}")
         raise
     
+    if Config.MODEL_RELOAD_INTERVAL > 0:
+        registry.start_watcher(Config.MODEL_RELOAD_INTERVAL)
+    
+    app.extensions['model_registry'] = registry
+    
+    # Async prediction jobs run outside any request, straight from the stored upload
+    def run_job(data, filename, plant_type):
+        try:
+            image = open_image_rgb(io.BytesIO(data))
+        except Exception:
+            return {'success': False, 'error': 'Invalid image file', 'timestamp': datetime.now().isoformat()}
+        
+        result = registry.predict(image, plant_type, data)
+        result['file_info'] = {
+            'original_filename': filename,
+            'file_size': len(data),
+            'file_size_mb': round(len(data) / (1024*1024), 2)
+        }
+        return result
+    
+    jobs = None
+    if Config.JOBS_ENABLED:
+        jobs = JobQueue(
+            Config.JOBS_DB_PATH, run_job,
+            num_workers=Config.JOB_WORKERS,
+            lease_seconds=Config.JOB_LEASE_SECONDS,
+            max_attempts=Config.JOB_MAX_ATTEMPTS,
+            result_ttl=Config.JOB_RESULT_TTL,
+            max_pending=Config.JOB_MAX_PENDING,
+            callback_timeout=Config.JOB_CALLBACK_TIMEOUT,
+            callback_retries=Config.JOB_CALLBACK_RETRIES,
+            callback_hosts=Config.JOB_CALLBACK_ALLOWED_HOSTS
+        )
+        jobs.start()
+    
+    app.extensions['prediction_jobs'] = jobs
+    
+    admission = None
+    if Config.ADMISSION_ENABLED:
+        admission = AdmissionController(
+            Config.ADMISSION_MAX_CONCURRENT, Config.ADMISSION_QUEUE_SIZE, Config.ADMISSION_QUEUE_TIMEOUT
+        )
+    
+    # Endpoints that buffer an upload and/or run inference
+    ADMISSION_ENDPOINTS = {'web_predict', 'api_predict', 'api_predict_batch', 'api_submit_job'}
+    
+    # Static class/plant payloads are serialized once, compact like jsonify
+    def serialize(payload):
+        return app.json.dumps(payload, separators=(',', ':')) + '\n'
+    
+    classes_payload = serialize({
+        'total_classes': NUM_CLASSES,
+        'classes': [
+            {
+                'class_en': class_en,
+                'class_vi': CLASS_NAMES_VI[i],
+                'plant_prefix': CLASS_PREFIXES[i],
+                'is_healthy': bool(HEALTHY_MASK[i])
+            }
+            for i, class_en in enumerate(ALL_CLASSES)
+        ]
+    })
+    
+    unique_prefixes = sorted(set(PLANT_ALIAS.values()))
+    plants_payload = serialize({
+        'total_plants': len(unique_prefixes),
+        'plants': [
+            {
+                'prefix': prefix,
+                'vietnamese_names': [k for k, v in PLANT_ALIAS.items() if v == prefix and not k.isascii()],
+                'english_names': [k for k, v in PLANT_ALIAS.items() if v == prefix and k.isascii()],
+                'disease_count': len(PLANT_CLASS_INDICES.get(prefix, ()))
+            }
+            for prefix in unique_prefixes
+        ]
+    })
+    
+    # ================= REQUEST METRICS ================= #
+    
+    METRICS.register(Gauge(
+        'plant_disease_batch_queue_depth', 'Requests waiting in the micro-batch queue',
+        lambda: sum(v.detector.batcher.queue_depth for v in registry.versions() if v.detector.batcher)
+    ))
+    METRICS.register(Gauge(
+        'plant_disease_interpreters_in_use', 'Pooled interpreters currently checked out',
+        lambda: sum(v.detector.pool.stats()['in_use'] for v in registry.versions())
+    ))
+    if jobs is not None:
+        METRICS.register(Gauge(
+            'plant_disease_jobs_pending', 'Async jobs queued or running (all processes)',
+            jobs.pending
+        ))
+    if Config.PREDICTION_CACHE_SIZE > 0:
+        for field in ('hits', 'disk_hits', 'misses', 'evictions', 'disk_evictions'):
+            METRICS.register(CounterCallback(
+                f'plant_disease_cache_{field}_total', f'Prediction cache {field.replace("_", " ")}',
+                lambda field=field: sum(v.detector.cache.stats()[field] for v in registry.versions())
+            ))
+    if Config.NEAR_DUPLICATE_ENABLED:
+        for field in ('hits', 'misses'):
+            METRICS.register(CounterCallback(
+                f'plant_disease_near_duplicate_{field}_total', f'Near-duplicate index {field}',
+                lambda field=field: sum(v.detector.near_index.stats()[field] for v in registry.versions())
+            ))
+    
+    if admission is not None:
+        METRICS.register(Gauge(
+            'plant_disease_admission_waiting', 'Requests waiting for an admission slot',
+            lambda: admission.waiting
+        ))
+        METRICS.register(CounterCallback(
+            'plant_disease_admission_rejected_total', 'Requests refused by admission control',
+            lambda: admission.rejected
+        ))
+    
+    def reject_request(status, message, retry_after=None):
+        """Refuse a request before its body is read"""
+        if request.endpoint == 'web_predict':
+            flash(f'❌ {message}', 'error')
+            response = redirect(url_for('index'))
+        else:
+            response = jsonify({'success': False, 'error': message, 'timestamp': datetime.now().isoformat()})
+            response.status_code = status
+        if retry_after:
+            response.headers['Retry-After'] = str(retry_after)
+        # The unread body must not be parsed as the next request on this connection
+        response.headers['Connection'] = 'close'
+        return response
+    
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        
+        if request.endpoint in ADMISSION_ENDPOINTS:
+            # Refuse oversized bodies from the header alone
+            if request.content_length is not None and request.content_length > Config.MAX_CONTENT_LENGTH:
+                return reject_request(413, 'File too large. Maximum size is 16MB')
+            
+            if admission is not None:
+                admitted = admission.acquire()
+                # Queue wait is its own stage so it never shows up as upload time under load
+                observe_stage('admission_wait', time.perf_counter() - g.request_start)
+                if not admitted:
+                    return reject_request(503, 'Server busy, retry later', admission.retry_after())
+                g.admitted_at = time.perf_counter()
+        
+        # Time multipart parsing (upload read) separately from decoding
+        if request.method == 'POST' and request.mimetype == 'multipart/form-data':
+            upload_start = time.perf_counter()
+            request.files
+            observe_stage('upload', time.perf_counter() - upload_start)
+    
+    @app.teardown_request
+    def stop_request_timer(exc=None):
+        if 'request_start' not in g:
+            return
+        if 'admitted_at' in g:
+            admission.release(time.perf_counter() - g.admitted_at)
+        REQUESTS_IN_FLIGHT.dec()
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_DURATION.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    
+    @app.after_request
+    def count_error_responses(response):
+        if response.status_code >= 400:
+            ERRORS.inc(type=f'http_{response.status_code}')
+        return response
+    
     def allowed_file(filename):
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
     
-    def validate_image(file_stream):
-        """Validate uploaded image"""
+    def timed_decode(source):
+        """Decode an image stream to RGB, or None if invalid, recording the decode stage"""
+        stage_start = time.perf_counter()
         try:
-            image = Image.open(file_stream)
-            if image.mode in ('RGBA', 'P'):
-                image = image.convert('RGB')
-            return True
+            return open_image_rgb(source)
         except Exception:
-            return False
+            return None
+        finally:
+            elapsed = time.perf_counter() - stage_start
+            g.decode_time = getattr(g, 'decode_time', 0.0) + elapsed
+            observe_stage('decode', elapsed)
+    
+    def decode_image(file):
+        """Decode an uploaded image once, in memory. Returns (RGB image or None if invalid, raw bytes)"""
+        file.stream.seek(0)
+        data = file.read()
+        return timed_decode(io.BytesIO(data)), data
+    
+    def reduce_upload(file):
+        """Decode a batch upload straight to what predict_batch needs, then free the upload.
+        
+        Returns (model input array, perceptual hash or None, content digest, size in bytes),
+        or None if the image is invalid. Only one upload is ever held decoded at full size.
+        """
+        image, data = decode_image(file)
+        file.close()
+        if image is None:
+            return None
+        image_hash = PERCEPTUAL_HASHES[Config.NEAR_DUPLICATE_ALGORITHM](image) if Config.NEAR_DUPLICATE_ENABLED else None
+        return image_to_array(image), image_hash, PredictionCache.content_digest(data), len(data)
+    
+    def requested_model():
+        """Model id ('name:version') or name from ?model= or the form; None means the traffic split"""
+        return request.args.get('model') or request.form.get('model') or None
+    
+    def request_option(name):
+        """Option from the query string, the form, or a JSON body"""
+        value = request.args.get(name) or request.form.get(name)
+        if value is None and request.is_json:
+            body = request.get_json(silent=True)
+            value = body.get(name) if isinstance(body, dict) else None
+        return value
+    
+    def response_options():
+        """(top_k, fields, compact) for shaping prediction responses; raises ValueError if invalid"""
+        top_k = request_option('top_k')
+        if top_k is not None:
+            try:
+                top_k = int(top_k)
+            except (TypeError, ValueError):
+                top_k = 0
+            if not 1 <= top_k <= NUM_CLASSES:
+                raise ValueError(f'top_k must be an integer between 1 and {NUM_CLASSES}')
+        
+        fields = request_option('fields')
+        fields = {field.strip() for field in str(fields).split(',') if field.strip()} if fields else None
+        
+        compact = str(request_option('format') or '').lower() == 'compact'
+        return top_k, fields, compact
+    
+    def select_fields(result, fields):
+        """Keep only the requested top-level fields (success/error always stay)"""
+        if not fields:
+            return result
+        return {key: value for key, value in result.items() if key in fields or key in ('success', 'error')}
+    
+    def respond(payload):
+        """JSON, or MessagePack when the Accept header prefers it"""
+        mimetype = request.accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES, 'application/json')
+        if mimetype not in MSGPACK_MIMETYPES:
+            return jsonify(payload)
+        
+        msgpack = load_msgpack()
+        if msgpack is None:
+            return jsonify({'success': False, 'error': 'MessagePack responses are not available'}), 406
+        return app.response_class(msgpack.packb(payload), mimetype=mimetype)
+    
+    def image_reference():
+        """image_path / image_hash from the form or a JSON body, or None when neither was sent"""
+        fields = request.form or request.get_json(silent=True)
+        if not hasattr(fields, 'get'):
+            return None
+        image_path, image_hash = fields.get('image_path'), fields.get('image_hash')
+        if not image_path and not image_hash:
+            return None
+        return image_path, image_hash, fields.get('plant_type'), fields.get('model') or requested_model()
+    
+    def predict_from_reference(image_path, image_hash, plant_type, model=None):
+        """Predict straight from a file on the shared volume, no upload or copy"""
+        if not Config.SHARED_IMAGE_ROOT:
+            return jsonify({'success': False, 'error': 'Predict-by-reference is not enabled'}), 400
+        
+        try:
+            path = resolve_shared_image(Config.SHARED_IMAGE_ROOT, image_path, image_hash)
+        except FileNotFoundError as e:
+            return jsonify({'success': False, 'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        if not allowed_file(path):
+            return jsonify({
+                'success': False,
+                'error': f'Invalid file type. Allowed: {", ".join(Config.ALLOWED_EXTENSIONS)}'
+            }), 400
+        
+        try:
+            top_k, fields, compact = response_options()
+            data = read_image_file(path)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except OSError as e:
+            return jsonify({'success': False, 'error': f'Image could not be read: {e.strerror}'}), 404
+        
+        image = timed_decode(io.BytesIO(data))
+        if image is None:
+            return jsonify({'success': False, 'error': 'Invalid image file'}), 400
+        file_size = len(data)
+        try:
+            result = registry.predict(image, plant_type, data, model, top_k, compact)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        add_decode_timing(result)
+        result['file_info'] = {
+            'original_filename': os.path.relpath(path, os.path.realpath(Config.SHARED_IMAGE_ROOT)),
+            'file_size': file_size,
+            'file_size_mb': round(file_size / (1024*1024), 2),
+            'source': 'shared_volume'
+        }
+        return respond(select_fields(result, fields))
+    
+    def add_decode_timing(result):
+        if 'timings_ms' in result and 'decode_time' in g:
+            result['timings_ms'] = {'decode': round(g.decode_time * 1000, 3), **result['timings_ms']}
     
     # ================= WEB UI ROUTES ================= #
     
@@ -377,15 +2844,19 @@ def create_app():
                 'endpoints': {
                     'GET /': 'Web interface and API documentation',
                     'POST /predict': 'Predict plant disease from image',
+                    'POST /predict/batch': 'Predict plant diseases for many images in one call',
                     'POST /web-predict': 'Web form prediction',
                     'GET /health': 'Service health check',
+                    'GET /models': 'Registered models, traffic split and per-model stats',
+                    'POST /models/reload': 'Hot-reload models from disk',
+                    'GET /metrics': 'Prometheus metrics',
                     'GET /classes': 'Get all disease classes',
                     'GET /plants': 'Get all plant types'
                 },
                 'model_info': {
                     'total_classes': len(ALL_CLASSES),
                     'supported_plants': len(set(PLANT_ALIAS.values())),
-                    'model_path': detector.model_path
+                    'model_path': registry.default.detector.model_path
                 },
                 'features': [
                     'Web interface with drag & drop',
@@ -424,38 +2895,23 @@ def create_app():
             return redirect(url_for('index'))
         
         try:
-            # Validate image
-            file.seek(0)
-            if not validate_image(io.BytesIO(file.read())):
+            # Decode and validate image in memory
+            image, data = decode_image(file)
+            if image is None:
                 flash('❌ File không phải là ảnh hợp lệ!', 'error')
                 return redirect(url_for('index'))
-            file.seek(0)
             
-            # Save file temporarily
+            # Run prediction
             filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            unique_filename = f"{timestamp}_{filename}"
-            filepath = os.path.join(Config.UPLOAD_FOLDER, unique_filename)
-            file.save(filepath)
+            result = registry.predict(image, plant_type if plant_type else None, data, requested_model())
+            result['filename'] = filename
             
-            try:
-                # Run prediction
-                result = detector.predict(filepath, plant_type if plant_type else None)
-                result['filename'] = filename
-                
-                if result['success']:
-                    flash(f'✅ Phân tích thành công! Kết quả: {result["prediction"]["class_vi"]}', 'success')
-                else:
-                    flash(f'❌ Lỗi phân tích: {result["error"]}', 'error')
-                
-                return render_template('index.html', result=result)
-                
-            finally:
-                # Clean up
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
+            if result['success']:
+                flash(f'✅ Phân tích thành công! Kết quả: {result["prediction"]["class_vi"]}', 'success')
+            else:
+                flash(f'❌ Lỗi phân tích: {result["error"]}', 'error')
+            
+            return render_template('index.html', result=result)
                 
         except Exception as e:
             flash(f'❌ Lỗi xử lý: {str(e)}', 'error')
@@ -465,13 +2921,21 @@ def create_app():
     
     @app.route('/predict', methods=['POST'])
     def api_predict():
-        """API prediction endpoint"""
+        """API prediction endpoint (multipart upload, or image_path/image_hash on the shared volume)"""
         try:
             if 'image' not in request.files:
+                reference = image_reference()
+                if reference is not None:
+                    return predict_from_reference(*reference)
                 return jsonify({'success': False, 'error': 'No image file provided'}), 400
             
             file = request.files['image']
             plant_type = request.form.get('plant_type', None)
+            model = requested_model()
+            try:
+                top_k, fields, compact = response_options()
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
             
             if file.filename == '':
                 return jsonify({'success': False, 'error': 'No file selected'}), 400
@@ -482,102 +2946,279 @@ def create_app():
                     'error': f'Invalid file type. Allowed: {", ".join(Config.ALLOWED_EXTENSIONS)}'
                 }), 400
             
-            # Validate image
-            file.seek(0)
-            if not validate_image(io.BytesIO(file.read())):
+            # Decode and validate image in memory
+            image, data = decode_image(file)
+            if image is None:
                 return jsonify({'success': False, 'error': 'Invalid image file'}), 400
-            file.seek(0)
             
-            # Save file temporarily
+            # Run prediction
             filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            unique_filename = f"{timestamp}_{filename}"
-            file_path = os.path.join(Config.UPLOAD_FOLDER, unique_filename)
-            file.save(file_path)
+            result = registry.predict(image, plant_type, data, model, top_k, compact)
+            add_decode_timing(result)
+            
+            # Add file info
+            file_size = len(data)
+            result['file_info'] = {
+                'original_filename': filename,
+                'file_size': file_size,
+                'file_size_mb': round(file_size / (1024*1024), 2)
+            }
+            
+            return respond(select_fields(result, fields))
+        
+        except KeyError as e:
+            return jsonify({'success': False, 'error': e.args[0]}), 400
+        
+        except RequestEntityTooLarge:
+            return jsonify({'success': False, 'error': 'File too large. Maximum size is 16MB'}), 413
+        
+        except Exception as e:
+            app.logger.error(f"API prediction error: {str(e)}")
+            return jsonify({
+                'success': False, 
+                'error': 'Internal server error',
+                'details': str(e) if Config.DEBUG else None
+            }), 500
+    
+    @app.route('/predict/batch', methods=['POST'])
+    def api_predict_batch():
+        """API batch prediction endpoint - many images, one batched inference"""
+        try:
+            files = request.files.getlist('images')
+            if not files:
+                return jsonify({'success': False, 'error': 'No image files provided'}), 400
+            if len(files) > Config.MAX_BATCH_IMAGES:
+                return jsonify({
+                    'success': False,
+                    'error': f'Too many images: {len(files)}. Maximum is {Config.MAX_BATCH_IMAGES} per request'
+                }), 413
             
             try:
-                # Run prediction
-                result = detector.predict(file_path, plant_type)
-                
-                # Add file info
-                result['file_info'] = {
-                    'original_filename': filename,
-                    'file_size': os.path.getsize(file_path),
-                    'file_size_mb': round(os.path.getsize(file_path) / (1024*1024), 2)
-                }
+                top_k, fields, compact = response_options()
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            
+            # plant_type may be sent once for all images or once per image
+            plant_types = request.form.getlist('plant_type')
+            if len(plant_types) == 1:
+                plant_types = plant_types * len(files)
+            elif plant_types and len(plant_types) != len(files):
+                return jsonify({
+                    'success': False,
+                    'error': 'plant_type must be given once or once per image'
+                }), 400
+            plant_types = [p or None for p in plant_types] or [None] * len(files)
+            
+            results = [None] * len(files)
+            images = []
+            image_hashes = []
+            digests = []
+            file_infos = []
+            batch_indices = []
+            
+            for i, file in enumerate(files):
+                if file.filename == '' or not allowed_file(file.filename):
+                    results[i] = {
+                        'success': False,
+                        'error': f'Invalid file type. Allowed: {", ".join(Config.ALLOWED_EXTENSIONS)}'
+                    }
+                    continue
                 
-                return jsonify(result)
+                # Decode and validate image in memory, keeping only the model input
+                reduced = reduce_upload(file)
+                if reduced is None:
+                    results[i] = {'success': False, 'error': 'Invalid image file'}
+                    continue
                 
-            finally:
-                # Clean up
+                image_array, image_hash, digest, size = reduced
+                images.append(image_array)
+                image_hashes.append(image_hash)
+                digests.append(digest)
+                file_infos.append({
+                    'original_filename': secure_filename(file.filename),
+                    'file_size': size
+                })
+                batch_indices.append(i)
+            
+            # Run batched prediction
+            batch_results = registry.predict_batch(
+                images, [plant_types[i] for i in batch_indices], digests, requested_model(), top_k, compact,
+                image_hashes
+            )
+            
+            for i, file_info, result in zip(batch_indices, file_infos, batch_results):
+                result['file_info'] = file_info
+                results[i] = result
+            
+            return respond({
+                'success': True,
+                'total': len(results),
+                'succeeded': sum(1 for r in results if r.get('success')),
+                'results': [select_fields(r, fields) for r in results],
+                'timestamp': datetime.now().isoformat()
+            })
+        
+        except KeyError as e:
+            return jsonify({'success': False, 'error': e.args[0]}), 400
+        
+        except RequestEntityTooLarge:
+            return jsonify({'success': False, 'error': 'Request too large. Maximum size is 16MB'}), 413
+        
+        except Exception as e:
+            app.logger.error(f"API batch prediction error: {str(e)}")
+            return jsonify({
+                'success': False,
+                'error': 'Internal server error',
+                'details': str(e) if Config.DEBUG else None
+            }), 500
+    
+    @app.route('/jobs', methods=['POST'])
+    def api_submit_job():
+        """Queue a prediction and return its job id immediately"""
+        try:
+            if jobs is None:
+                return jsonify({'success': False, 'error': 'Async jobs are disabled'}), 503
+            
+            if 'image' not in request.files:
+                return jsonify({'success': False, 'error': 'No image file provided'}), 400
+            
+            file = request.files['image']
+            plant_type = request.form.get('plant_type', None)
+            callback_url = request.form.get('callback_url', None)
+            
+            if file.filename == '':
+                return jsonify({'success': False, 'error': 'No file selected'}), 400
+            
+            if not allowed_file(file.filename):
+                return jsonify({
+                    'success': False,
+                    'error': f'Invalid file type. Allowed: {", ".join(Config.ALLOWED_EXTENSIONS)}'
+                }), 400
+            
+            if callback_url:
                 try:
-                    os.remove(file_path)
-                except:
-                    pass
+                    check_callback_url(callback_url, Config.JOB_CALLBACK_ALLOWED_HOSTS)
+                except ValueError as e:
+                    return jsonify({'success': False, 'error': str(e)}), 400
+            
+            # Only the header is read here; full decoding happens in the job worker
+            file.stream.seek(0)
+            data = file.read()
+            try:
+                Image.open(io.BytesIO(data))
+            except Exception:
+                return jsonify({'success': False, 'error': 'Invalid image file'}), 400
+            
+            try:
+                job_id = jobs.submit(data, secure_filename(file.filename), plant_type, callback_url or None)
+            except queue.Full as e:
+                return jsonify({'success': False, 'error': str(e)}), 503
+            
+            status_url = url_for('api_get_job', job_id=job_id)
+            response = jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': status_url,
+                'timestamp': datetime.now().isoformat()
+            })
+            response.headers['Location'] = status_url
+            return response, 202
         
         except RequestEntityTooLarge:
             return jsonify({'success': False, 'error': 'File too large. Maximum size is 16MB'}), 413
         
         except Exception as e:
-            app.logger.error(f"API prediction error: {str(e)}")
+            app.logger.error(f"API job submit error: {str(e)}")
             return jsonify({
-                'success': False, 
+                'success': False,
                 'error': 'Internal server error',
                 'details': str(e) if Config.DEBUG else None
             }), 500
     
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def api_get_job(job_id):
+        """Status and, once done, result of an async prediction job"""
+        if jobs is None:
+            return jsonify({'success': False, 'error': 'Async jobs are disabled'}), 503
+        
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        
+        return jsonify({'success': True, **job, 'timestamp': datetime.now().isoformat()})
+    
     @app.route('/health', methods=['GET'])
     def health_check():
         """Health check endpoint"""
+        detector = registry.default.detector
         return jsonify({
             'status': 'healthy',
             'service': 'Plant Disease Detection AI',
             'version': '1.0.0',
-            'model_loaded': detector.interpreter is not None,
+            'model_loaded': detector.pool is not None,
+            'runtime': interpreter_backend(),
+            'tuning': {
+                'file': TUNING_FILE if TUNED_SETTINGS else None,
+                'interpreter_threads': Config.INTERPRETER_THREADS,
+                'interpreter_pool_size': Config.INTERPRETER_POOL_SIZE,
+                'workers': Config.WORKERS
+            },
+            'interpreter_pool': detector.pool.stats(),
+            'prediction_cache': detector.cache.stats() if detector.cache else {'enabled': False},
+            'near_duplicate_index': detector.near_index.stats() if detector.near_index else {'enabled': False},
             'model_path': detector.model_path,
+            'micro_batching': detector.batcher.stats() if detector.batcher else {'enabled': False},
+            'cascade': detector.cascade_stats(),
+            'models': registry.stats(),
+            'jobs': jobs.stats() if jobs else {'enabled': False},
+            'admission': admission.stats() if admission else {'enabled': False},
             'uptime': 'running',
             'timestamp': datetime.now().isoformat()
         })
     
+    @app.route('/models', methods=['GET'])
+    def list_models():
+        """Registered models with traffic weights, per-model usage/latency and shadow agreement"""
+        return jsonify({'success': True, **registry.stats(), 'timestamp': datetime.now().isoformat()})
+    
+    @app.route('/models/reload', methods=['POST'])
+    def reload_models():
+        """Hot-reload the registry file (or one model with {"model": "name:version"}) without dropping requests"""
+        # A reload rebuilds interpreter pools, so it is never open to anonymous callers
+        if not Config.MODEL_ADMIN_TOKEN:
+            return jsonify({'success': False, 'error': 'Model reload is disabled (MODEL_ADMIN_TOKEN is not set)'}), 403
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), Config.MODEL_ADMIN_TOKEN.encode()):
+            return jsonify({'success': False, 'error': 'Invalid admin token'}), 403
+        
+        model = (request.get_json(silent=True) or {}).get('model') or request.args.get('model')
+        try:
+            outcome = registry.reload(model)
+        except KeyError as e:
+            return jsonify({'success': False, 'error': e.args[0]}), 404
+        except (OSError, ValueError) as e:
+            return jsonify({'success': False, 'error': f'Invalid model registry: {str(e)}'}), 400
+        
+        return jsonify({
+            'success': not outcome['failed'],
+            **outcome,
+            'timestamp': datetime.now().isoformat()
+        }), 200 if not outcome['failed'] else 500
+    
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus metrics endpoint"""
+        return app.response_class(METRICS.render(), content_type=MetricsRegistry.CONTENT_TYPE)
+    
     @app.route('/classes', methods=['GET'])
     def get_classes():
         """Get all supported disease classes"""
-        classes_info = []
-        for class_en in ALL_CLASSES:
-            classes_info.append({
-                'class_en': class_en,
-                'class_vi': VIET_NAMES.get(class_en, class_en),
-                'plant_prefix': class_en.split('___')[0],
-                'is_healthy': 'healthy' in class_en.lower()
-            })
-        
-        return jsonify({
-            'total_classes': len(ALL_CLASSES),
-            'classes': classes_info
-        })
+        return app.response_class(classes_payload, mimetype='application/json')
     
     @app.route('/plants', methods=['GET'])
     def get_plants():
         """Get all supported plant types"""
-        unique_prefixes = set(PLANT_ALIAS.values())
-        plants_info = []
-        
-        for prefix in sorted(unique_prefixes):
-            vi_names = [k for k, v in PLANT_ALIAS.items() if v == prefix and not k.isascii()]
-            en_names = [k for k, v in PLANT_ALIAS.items() if v == prefix and k.isascii()]
-            disease_count = len([c for c in ALL_CLASSES if c.startswith(prefix + "___")])
-            
-            plants_info.append({
-                'prefix': prefix,
-                'vietnamese_names': vi_names,
-                'english_names': en_names,
-                'disease_count': disease_count
-            })
-        
-        return jsonify({
-            'total_plants': len(unique_prefixes),
-            'plants': plants_info
-        })
+        return app.response_class(plants_payload, mimetype='application/json')
     
     # ================= ERROR HANDLERS ================= #
     
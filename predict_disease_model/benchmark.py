@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Plant Disease Detection AI Service - Benchmarks
+Author: VietTranDai
+
+Usage:
+    python benchmark.py startup [--backends tflite_runtime tensorflow] [--repeat 5]
+    python benchmark.py preprocess [--batch-size 8] [--iterations 50]
+    python benchmark.py throughput [--target detector http] [--concurrency 1 4 8]
+                                   [--batch-sizes 1 8] [--threads 1 4] [--images-dir ../pictures/photo_evaluations]
+    python benchmark.py compare baseline.json candidate.json
+    python benchmark.py tune [--duration 10] [--tuning-file tuning.json]
+
+Every command prints a JSON report (or writes it with --output) so results can
+be diffed between commits.
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import threading
+import time
+import tracemalloc
+import io
+import glob
+import resource
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ================= STARTUP BENCHMARK ================= #
+# Runs in a fresh interpreter per sample so import caches never leak between runs
+STARTUP_PROBE = r'''
+import json, os, resource, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.load_interpreter_class()
+t2 = time.perf_counter()
+model_load = None
+if os.path.exists(app.Config.TFLITE_PATH):
+    app.PlantDiseaseDetector(app.Config.TFLITE_PATH)
+    model_load = time.perf_counter() - t2
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'backend': app.interpreter_backend(),
+    'app_import_s': t1 - t0,
+    'interpreter_import_s': t2 - t1,
+    'model_load_s': model_load,
+    'total_s': time.perf_counter() - t0,
+    'peak_rss_mb': rss_kb / 1024 if sys.platform != 'darwin' else rss_kb / (1024 * 1024),
+}))
+'''
+
+def run_startup_probe(backend: str) -> dict:
+    env = dict(os.environ, TFLITE_BACKEND=backend, MICRO_BATCH_ENABLED='false', PREDICTION_CACHE_SIZE='0')
+    proc = subprocess.run(
+        [sys.executable, '-c', STARTUP_PROBE],
+        cwd=SERVICE_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'probe failed'}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def summarize(samples: list, key: str):
+    values = [s[key] for s in samples if s.get(key) is not None]
+    if not values:
+        return None
+    return {
+        'median': round(statistics.median(values), 4),
+        'min': round(min(values), 4),
+        'max': round(max(values), 4)
+    }
+
+def bench_startup(args) -> dict:
+    results = {}
+    for backend in args.backends:
+        samples = [run_startup_probe(backend) for _ in range(args.repeat)]
+        errors = [s['error'] for s in samples if 'error' in s]
+        samples = [s for s in samples if 'error' not in s]
+        
+        if not samples:
+            results[backend] = {'available': False, 'error': errors[0]}
+            continue
+        
+        results[backend] = {
+            'available': True,
+            'samples': len(samples),
+            **{key: summarize(samples, key) for key in (
+                'app_import_s', 'interpreter_import_s', 'model_load_s', 'total_s', 'peak_rss_mb'
+            )}
+        }
+    return results
+
+# ================= PREPROCESS BENCHMARK ================= #
+def legacy_preprocess(image_arrays, dtype, quantization, input_buffer):
+    """Original path: float temporaries per image, np.stack, then a copy into the input tensor"""
+    if dtype == np.float32:
+        processed = [arr.astype(np.float32) / 255.0 for arr in image_arrays]
+    else:
+        scale, zero_point = quantization
+        processed = [((arr.astype(np.float32) / 255.0) / scale + zero_point).astype(dtype) for arr in image_arrays]
+    input_buffer[...] = np.stack(processed)
+
+def measure(fn, iterations: int) -> dict:
+    fn()  # warm-up
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'ms_per_batch': round(elapsed / iterations * 1000, 3), 'peak_alloc_kb': round(peak / 1024, 1)}
+
+def bench_preprocess(args) -> dict:
+    import app
+    
+    size = app.Config.IMG_SIZE
+    rng = np.random.default_rng(0)
+    image_arrays = [rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(args.batch_size)]
+    
+    results = {}
+    for name, dtype, quantization in (
+        ('float32', np.float32, (0.0, 0)),
+        ('int8', np.int8, (0.0078125, -128)),
+    ):
+        # Stands in for the interpreter's input tensor view
+        input_buffer = np.empty((args.batch_size, size, size, 3), dtype=dtype)
+        input_quantization = app.input_quantization(dtype, quantization)
+        
+        legacy = measure(lambda: legacy_preprocess(image_arrays, dtype, quantization, input_buffer), args.iterations)
+        legacy_out = input_buffer.copy()
+        in_place = measure(
+            lambda: app.fill_input_tensor(input_buffer, image_arrays, input_quantization), args.iterations
+        )
+        
+        results[name] = {
+            'legacy': legacy,
+            'in_place': in_place,
+            'identical_output': bool(np.array_equal(legacy_out, input_buffer))
+        }
+    return results
+
+# ================= THROUGHPUT BENCHMARK ================= #
+SAMPLE_SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+SAMPLE_FORMATS = ['JPEG', 'PNG']
+
+def synthetic_images(sizes, formats) -> list:
+    """Smooth random images; pure noise would make JPEG/PNG decode unrealistically slow"""
+    from PIL import Image
+    
+    rng = np.random.default_rng(0)
+    samples = []
+    for width, height in sizes:
+        coarse = rng.integers(0, 256, (height // 32 + 1, width // 32 + 1, 3), dtype=np.uint8)
+        image = Image.fromarray(coarse).resize((width, height), Image.BILINEAR)
+        for fmt in formats:
+            buffer = io.BytesIO()
+            image.save(buffer, format=fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+            samples.append((f"synthetic_{width}x{height}.{fmt.lower()}", buffer.getvalue()))
+    return samples
+
+def directory_images(path: str) -> list:
+    samples = []
+    for pattern in ('*.jpg', '*.jpeg', '*.JPG', '*.JPEG', '*.png'):
+        for file_path in sorted(glob.glob(os.path.join(path, pattern))):
+            with open(file_path, 'rb') as f:
+                samples.append((os.path.basename(file_path), f.read()))
+    return samples
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 1024 if sys.platform != 'darwin' else rss / (1024 * 1024), 1)
+
+def latency_summary(latencies: list, wall_time: float, images: int, rss_mb: float) -> dict:
+    """rss_mb: peak RSS of the process that did the work (ru_maxrss never goes down, so one process per run)"""
+    values = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'images': images,
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'mean_ms': round(float(values.mean()), 3),
+        'images_per_s': round(images / wall_time, 2),
+        'peak_rss_mb': rss_mb
+    }
+
+def run_load(call, payloads: list, concurrency: int, requests: int) -> tuple:
+    """Issue `requests` calls round-robin over payloads from `concurrency` threads"""
+    latencies = []
+    lock = threading.Lock()
+    
+    def one(i):
+        start = time.perf_counter()
+        call(payloads[i % len(payloads)])
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return latencies, time.perf_counter() - start
+
+def detector_call(app, detector, batch_size: int):
+    def call(chunk):
+        images = [app.open_image_rgb(io.BytesIO(data)) for _, data in chunk]
+        if batch_size == 1:
+            result = detector.predict(images[0])
+            results = [result]
+        else:
+            results = detector.predict_batch(images)
+        if not all(r['success'] for r in results):
+            raise RuntimeError(results[0].get('error'))
+    return call
+
+def http_call(flask_app, batch_size: int):
+    local = threading.local()
+    
+    def call(chunk):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = flask_app.test_client()
+        if batch_size == 1:
+            name, data = chunk[0]
+            response = client.post('/predict', data={'image': (io.BytesIO(data), name)})
+        else:
+            files = [(io.BytesIO(data), name) for name, data in chunk]
+            response = client.post('/predict/batch', data={'images': files})
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return call
+
+# Each run gets a fresh process: ru_maxrss is a high-water mark for the whole
+# process, and each process builds one app (one set of job-queue threads)
+THROUGHPUT_PROBE = r'''
+import json, sys
+import benchmark
+print(json.dumps(benchmark.throughput_run(json.loads(sys.argv[1]))))
+'''
+
+def load_samples(images_dir: str = None) -> list:
+    samples = directory_images(images_dir) if images_dir else synthetic_images(SAMPLE_SIZES, SAMPLE_FORMATS)
+    if not samples:
+        raise SystemExit(f"No images found in {images_dir}")
+    return samples
+
+def throughput_run(run: dict) -> dict:
+    """One target/batch size/concurrency run in this (fresh) process; called by THROUGHPUT_PROBE"""
+    import app
+    
+    logging.getLogger().setLevel(logging.WARNING)
+    app.Config.LOG_LEVEL = logging.WARNING
+    
+    samples = load_samples(run['images_dir'])
+    batch_size = run['batch_size']
+    if run['target'] == 'http':
+        call = http_call(app.create_app(), batch_size)
+    else:
+        call = detector_call(app, app.PlantDiseaseDetector(app.Config.TFLITE_PATH), batch_size)
+    
+    payloads = [
+        [samples[(i + j) % len(samples)] for j in range(batch_size)]
+        for i in range(len(samples))
+    ]
+    call(payloads[0])  # warm-up
+    latencies, wall_time = run_load(call, payloads, run['concurrency'], run['requests'])
+    return {
+        'images': [name for name, _ in samples],
+        'run': {
+            'target': run['target'],
+            'threads': run['threads'],
+            'interpreters': app.Config.INTERPRETER_POOL_SIZE,
+            'batch_size': batch_size,
+            'concurrency': run['concurrency'],
+            **latency_summary(latencies, wall_time, len(latencies) * batch_size, peak_rss_mb())
+        }
+    }
+
+def run_throughput_probe(run: dict, interpreters: int) -> dict:
+    env = dict(
+        os.environ,
+        INTERPRETER_THREADS=str(run['threads']),
+        # Repeated payloads would otherwise be answered from the prediction cache
+        PREDICTION_CACHE_SIZE='0'
+    )
+    if interpreters:
+        env['INTERPRETER_POOL_SIZE'] = str(interpreters)
+    proc = subprocess.run(
+        [sys.executable, '-c', THROUGHPUT_PROBE, json.dumps(run)],
+        cwd=SERVICE_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'throughput probe failed')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def bench_throughput(args) -> dict:
+    images_dir = os.path.abspath(args.images_dir) if args.images_dir else None
+    
+    images, results = [], []
+    for threads in args.threads:
+        for target in args.target:
+            for batch_size in args.batch_sizes:
+                for concurrency in args.concurrency:
+                    report = run_throughput_probe({
+                        'target': target,
+                        'threads': threads,
+                        'batch_size': batch_size,
+                        'concurrency': concurrency,
+                        'requests': args.requests,
+                        'images_dir': images_dir
+                    }, args.interpreters)
+                    images = report['images']
+                    results.append(report['run'])
+                    print(f"{target} threads={threads} batch={batch_size} concurrency={concurrency}: "
+                          f"{report['run']['images_per_s']} images/s", file=sys.stderr)
+    
+    return {
+        'images': images,
+        'runs': results
+    }
+
+# ================= AUTO-TUNING ================= #
+# One probe process = one service worker. It loads the model with the given
+# thread/interpreter settings, signals READY, waits for GO on stdin, then
+# drives predict() from several threads for a fixed duration.
+TUNE_PROBE = r'''
+import json, resource, sys, threading, time
+import numpy as np
+from PIL import Image
+import app
+
+duration, concurrency = float(sys.argv[1]), int(sys.argv[2])
+detector = app.PlantDiseaseDetector(app.Config.TFLITE_PATH)
+size = app.Config.IMG_SIZE
+image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (size, size, 3), dtype=np.uint8))
+detector.predict(image)
+
+print('READY', flush=True)
+sys.stdin.readline()
+
+latencies = []
+lock = threading.Lock()
+deadline = time.perf_counter() + duration
+
+def drive():
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        detector.predict(image)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+threads = [threading.Thread(target=drive) for _ in range(concurrency)]
+start = time.perf_counter()
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'wall_s': time.perf_counter() - start,
+    'latencies': latencies,
+    'peak_rss_mb': round(rss_kb / 1024 if sys.platform != 'darwin' else rss_kb / (1024 * 1024), 1)
+}), flush=True)
+'''
+
+def powers_of_two_up_to(limit: int) -> list:
+    values = [1]
+    while values[-1] * 2 <= limit:
+        values.append(values[-1] * 2)
+    if limit not in values:
+        values.append(limit)
+    return values
+
+def tuning_candidates(cpu_count: int) -> list:
+    """(threads, interpreters, processes) combinations that do not oversubscribe the host"""
+    candidates = []
+    for threads in powers_of_two_up_to(cpu_count):
+        for interpreters in powers_of_two_up_to(max(1, cpu_count // threads)):
+            for processes in powers_of_two_up_to(max(1, cpu_count // (threads * interpreters))):
+                candidates.append((threads, interpreters, processes))
+    return candidates
+
+def run_tune_candidate(threads: int, interpreters: int, processes: int, args) -> dict:
+    env = dict(
+        os.environ,
+        INTERPRETER_THREADS=str(threads),
+        INTERPRETER_POOL_SIZE=str(interpreters),
+        PREDICTION_CACHE_SIZE='0',
+        TUNING_FILE=os.devnull
+    )
+    concurrency = interpreters * args.concurrency_per_interpreter
+    probes = [
+        subprocess.Popen(
+            [sys.executable, '-c', TUNE_PROBE, str(args.duration), str(concurrency)],
+            cwd=SERVICE_DIR, env=env, text=True,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        for _ in range(processes)
+    ]
+    try:
+        # Start every worker at once so they really compete for the cores
+        for probe in probes:
+            if probe.stdout.readline().strip() != 'READY':
+                raise RuntimeError('tuning probe failed to load the model')
+        for probe in probes:
+            probe.stdin.write('GO\n')
+            probe.stdin.flush()
+        reports = [json.loads(probe.stdout.readline()) for probe in probes]
+    finally:
+        for probe in probes:
+            if probe.poll() is None:
+                probe.kill()
+            probe.wait()
+    
+    latencies = [lat for report in reports for lat in report['latencies']]
+    wall_time = max(report['wall_s'] for report in reports)
+    return {
+        'INTERPRETER_THREADS': threads,
+        'INTERPRETER_POOL_SIZE': interpreters,
+        'WORKERS': processes,
+        # Largest single worker, as each probe stands for one service worker
+        **latency_summary(latencies, wall_time, len(latencies), max(report['peak_rss_mb'] for report in reports))
+    }
+
+def bench_tune(args) -> dict:
+    cpu_count = args.cpus or os.cpu_count() or 1
+    candidates = []
+    for threads, interpreters, processes in tuning_candidates(cpu_count):
+        try:
+            result = run_tune_candidate(threads, interpreters, processes, args)
+        except (RuntimeError, ValueError) as e:
+            result = {'INTERPRETER_THREADS': threads, 'INTERPRETER_POOL_SIZE': interpreters,
+                      'WORKERS': processes, 'error': str(e)}
+        candidates.append(result)
+        print(f"threads={threads} interpreters={interpreters} workers={processes}: "
+              f"{result.get('images_per_s', result.get('error'))}", file=sys.stderr)
+    
+    eligible = [
+        c for c in candidates
+        if 'error' not in c and (not args.max_p95_ms or c['p95_ms'] <= args.max_p95_ms)
+    ]
+    if not eligible:
+        raise SystemExit('No tuning candidate succeeded within the latency limit')
+    best = max(eligible, key=lambda c: (c['images_per_s'], -c['p95_ms']))
+    
+    tuning = {
+        'config': {key: best[key] for key in ('INTERPRETER_THREADS', 'INTERPRETER_POOL_SIZE', 'WORKERS')},
+        'measured': {key: best[key] for key in ('images_per_s', 'p50_ms', 'p95_ms', 'p99_ms')},
+        'host': host_info(),
+        'candidates': candidates
+    }
+    with open(args.tuning_file, 'w', encoding='utf-8') as f:
+        json.dump(tuning, f, indent=2)
+        f.write('\n')
+    return {'tuning_file': args.tuning_file, **tuning}
+
+# ================= COMPARE ================= #
+RUN_KEY_FIELDS = ('target', 'threads', 'interpreters', 'batch_size', 'concurrency')
+COMPARE_FIELDS = ('p50_ms', 'p95_ms', 'p99_ms', 'images_per_s', 'peak_rss_mb')
+
+def bench_compare(args) -> dict:
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding='utf-8') as f:
+        candidate = json.load(f)
+    
+    def index(report):
+        return {tuple(run[k] for k in RUN_KEY_FIELDS): run for run in report['results']['runs']}
+    
+    base_runs, cand_runs = index(baseline), index(candidate)
+    comparisons = []
+    for key in sorted(set(base_runs) & set(cand_runs)):
+        base, cand = base_runs[key], cand_runs[key]
+        comparisons.append({
+            **dict(zip(RUN_KEY_FIELDS, key)),
+            **{
+                field: {
+                    'baseline': base[field],
+                    'candidate': cand[field],
+                    'ratio': round(cand[field] / base[field], 3) if base[field] else None
+                }
+                for field in COMPARE_FIELDS
+            }
+        })
+    return {
+        'baseline': args.baseline,
+        'candidate': args.candidate,
+        'unmatched_runs': len(set(base_runs) ^ set(cand_runs)),
+        'runs': comparisons
+    }
+
+# ================= ENTRY POINT ================= #
+def host_info() -> dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': datetime.now().isoformat()
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plant Disease Detection AI benchmarks')
+    parser.add_argument('--output', help='Write JSON report to this file instead of stdout')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    startup = subparsers.add_parser('startup', help='Cold start time and RSS per interpreter backend')
+    startup.add_argument('--backends', nargs='+', default=['tflite_runtime', 'ai_edge_litert', 'tensorflow'])
+    startup.add_argument('--repeat', type=int, default=5)
+    startup.set_defaults(func=bench_startup)
+    
+    preprocess = subparsers.add_parser('preprocess', help='Per-batch allocations of input preprocessing')
+    preprocess.add_argument('--batch-size', type=int, default=8)
+    preprocess.add_argument('--iterations', type=int, default=50)
+    preprocess.set_defaults(func=bench_preprocess)
+    
+    throughput = subparsers.add_parser('throughput', help='Latency percentiles and images/s under load')
+    throughput.add_argument('--target', nargs='+', choices=['detector', 'http'], default=['detector', 'http'])
+    throughput.add_argument('--images-dir', help='Use images from this directory instead of synthetic ones')
+    throughput.add_argument('--concurrency', nargs='+', type=int, default=[1, 4])
+    throughput.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 8])
+    throughput.add_argument('--threads', nargs='+', type=int, default=[4],
+                            help='Intra-op threads per interpreter')
+    throughput.add_argument('--interpreters', type=int, default=0,
+                            help='Interpreter pool size (0 = service default)')
+    throughput.add_argument('--requests', type=int, default=50, help='Requests per run')
+    throughput.set_defaults(func=bench_throughput)
+    
+    tune = subparsers.add_parser('tune', help='Find the best threads x interpreters x workers for this host')
+    tune.add_argument('--duration', type=float, default=10.0, help='Seconds per candidate')
+    tune.add_argument('--cpus', type=int, default=0, help='Cores to plan for (0 = all)')
+    tune.add_argument('--concurrency-per-interpreter', type=int, default=2)
+    tune.add_argument('--max-p95-ms', type=float, default=0, help='Ignore candidates slower than this p95')
+    tune.add_argument('--tuning-file', default=os.environ.get('TUNING_FILE', os.path.join(SERVICE_DIR, 'tuning.json')))
+    tune.set_defaults(func=bench_tune)
+    
+    compare = subparsers.add_parser('compare', help='Diff two throughput reports')
+    compare.add_argument('baseline')
+    compare.add_argument('candidate')
+    compare.set_defaults(func=bench_compare)
+    
+    args = parser.parse_args(argv)
+    report = {'benchmark': args.command, 'host': host_info(), 'results': args.func(args)}
+    
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn configuration for the Plant Disease Detection AI Service
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The master never builds a TFLite interpreter (their thread pools do not
+survive fork). It verifies and memory-maps the model once, then each
+worker maps the same file, so model pages are shared through the page
+cache rather than copied per worker.
+
+Signals: HUP reloads gracefully (new workers start before old ones
+stop), TERM shuts down gracefully, TTIN/TTOU add/remove a worker.
+"""
+
+import os
+import sys
+
+from gunicorn.arbiter import Arbiter
+
+from app import Config, load_model_specs, resolve_model_path, map_model_file, verify_model_file
+
+# ================= SERVER ================= #
+bind = f"{Config.HOST}:{Config.PORT}"
+workers = Config.WORKERS
+worker_class = 'gthread'
+threads = Config.WORKER_THREADS  # concurrent requests per worker, feeds the micro-batcher
+preload_app = False
+
+# Recycle workers after N requests (jittered so they do not all restart together)
+max_requests = Config.MAX_REQUESTS_PER_WORKER
+max_requests_jitter = max(1, Config.MAX_REQUESTS_PER_WORKER // 10)
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# ================= HOOKS ================= #
+_model_mappings = []
+
+def _prepare_model(server):
+    """Verify every registry model file and keep one read-only mapping of each alive in the master.
+
+    The previous mappings are only swapped out once the whole new set has verified.
+    """
+    global _model_mappings
+    mappings = []
+    try:
+        for spec in load_model_specs(Config.MODEL_REGISTRY_FILE):
+            model_path = resolve_model_path(spec['path'])
+            # MODEL_SHA256 pins TFLITE_PATH; registry entries may carry their own sha256
+            expected = spec.get('sha256', Config.MODEL_SHA256 if spec['path'] == Config.TFLITE_PATH else '')
+            info = verify_model_file(model_path, expected.lower())
+            mappings.append(map_model_file(model_path))
+            
+            server.log.info(f"✅ Verified model {spec['id']} {info['path']} ({info['size_bytes'] / (1024 * 1024):.1f} MB)"
+                            + (f" sha256={info['sha256']}" if 'sha256' in info else ''))
+        
+        if Config.SCREEN_MODEL_PATH:
+            screen_info = verify_model_file(Config.SCREEN_MODEL_PATH)
+            server.log.info(f"✅ Verified screen model {screen_info['path']} "
+                            f"({screen_info['size_bytes'] / (1024 * 1024):.1f} MB)")
+    except Exception:
+        for mapped in mappings:
+            mapped.close()
+        raise
+    
+    previous, _model_mappings = _model_mappings, mappings
+    for mapped in previous:
+        mapped.close()
+
+def on_starting(server):
+    _prepare_model(server)
+
+def on_reload(server):
+    """A reload may follow a model file swap; refuse to roll workers onto a bad file.
+
+    Raising here would stop the arbiter and kill the running workers, and new
+    workers would fail to boot and halt it anyway. So log, and spawn no new
+    workers for this reload: Arbiter.reload spawns cfg.workers replacements,
+    while the running set is sized by server.num_workers. The next HUP
+    re-reads this file and restores cfg.workers. (The arbiter still waits
+    up to graceful_timeout for old workers to go before handling signals.)
+    """
+    try:
+        _prepare_model(server)
+    except Exception:
+        server.log.exception("❌ Model verification failed on reload, keeping the current workers")
+        server.cfg.set('workers', 0)
+
+def post_worker_init(worker):
+    """Fail the boot (and stop the arbiter) if this worker cannot run every registered model"""
+    try:
+        worker.wsgi.extensions['model_registry'].warmup()
+    except Exception:
+        worker.log.exception("❌ Model warm-up failed")
+        sys.exit(Arbiter.WORKER_BOOT_ERROR)
+    worker.log.info(f"Worker {worker.pid} ready")
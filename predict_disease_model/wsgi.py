@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WSGI entry point for the pre-forked server: gunicorn -c gunicorn.conf.py wsgi:app
+Each worker imports this module after fork and builds its own interpreters.
+"""
+
+from app import create_app
+
+app = create_app()
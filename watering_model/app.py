@@ -1,12 +1,23 @@
 from flask import Flask, request, jsonify, render_template
-import pandas as pd
 import numpy as np
 import joblib
 import json
 import os
+import hashlib
+import threading
+import time
+import warnings
+from collections import OrderedDict
 from datetime import datetime
 import logging
 
+# pandas is not needed on the request path: readings are packed straight into
+# float64 rows. It is only touched when a caller hands in a DataFrame itself.
+
+# The pipelines were fitted on DataFrames; positional NumPy rows are safe because
+# the column order is checked against feature_names_in_ once, at load time
+warnings.filterwarnings('ignore', message='X does not have valid feature names', category=UserWarning)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,6 +29,122 @@ MODEL_DIR = 'models'
 DECISION_MODEL_PATH = os.path.join(MODEL_DIR, 'watering_decision_model.pkl')
 AMOUNT_MODEL_PATH = os.path.join(MODEL_DIR, 'water_amount_model.pkl')
 
+# Array exports of the pipelines above (see export_models.py), loaded without unpickling
+DECISION_COMPILED_PATH = os.path.join(MODEL_DIR, 'watering_decision_model.npz')
+AMOUNT_COMPILED_PATH = os.path.join(MODEL_DIR, 'water_amount_model.npz')
+USE_COMPILED_MODELS = os.environ.get('USE_COMPILED_MODELS', 'true').lower() == 'true'
+
+# Upper bound on readings per /watering/decision/batch call
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 10000))
+
+# /watering/plan: longest forecast accepted (hours) and minimum spacing between recommended slots
+PLAN_MAX_HOURS = int(os.environ.get('PLAN_MAX_HOURS', 7 * 24))
+PLAN_MIN_INTERVAL_HOURS = float(os.environ.get('PLAN_MIN_INTERVAL_HOURS', 12))
+
+# In-memory sensor windows fed by /sensors/readings: readings kept per garden and sensor type,
+# gardens kept at most, and seconds without a reading before a garden is dropped
+SENSOR_WINDOW_SIZE = int(os.environ.get('SENSOR_WINDOW_SIZE', 32))
+SENSOR_MAX_GARDENS = int(os.environ.get('SENSOR_MAX_GARDENS', 5000))
+SENSOR_STALE_SECONDS = float(os.environ.get('SENSOR_STALE_SECONDS', 24 * 3600))
+# How far ahead of this host's clock a reading timestamp may be before it is rejected
+SENSOR_MAX_CLOCK_SKEW_SECONDS = float(os.environ.get('SENSOR_MAX_CLOCK_SKEW_SECONDS', 300))
+
+# Sensor types as in the backend's SensorType enum; the decision needs the first three
+SENSOR_TYPES = ('SOIL_MOISTURE', 'TEMPERATURE', 'LIGHT', 'WATER_LEVEL', 'HUMIDITY', 'RAINFALL', 'SOIL_PH')
+REQUIRED_SENSOR_TYPES = ('SOIL_MOISTURE', 'TEMPERATURE', 'LIGHT')
+DEFAULT_WATER_LEVEL = 80.0
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class CompiledLinearModel:
+    """
+    A StandardScaler + linear estimator pipeline flattened into NumPy arrays.
+    predict() repeats sklearn's arithmetic in the same order, so results match
+    the pipeline bit for bit while skipping its per-call validation overhead.
+    """
+    
+    def __init__(self, mean, scale, coef, intercept, classes=None, feature_names=None, source_sha256=None):
+        self.mean = np.ascontiguousarray(mean, dtype=np.float64)
+        self.scale = np.ascontiguousarray(scale, dtype=np.float64)
+        self.coef = np.ascontiguousarray(coef, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.classes = None if classes is None else np.asarray(classes)
+        self.feature_names_in_ = None if feature_names is None else np.asarray(feature_names, dtype=str)
+        self.source_sha256 = source_sha256
+    
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        """Flatten a fitted [StandardScaler ->] LogisticRegression/LinearRegression pipeline"""
+        steps = [step for _, step in getattr(pipeline, 'steps', [(None, pipeline)])]
+        estimator = steps[-1]
+        if len(steps) > 2 or type(estimator).__name__ not in ('LogisticRegression', 'LinearRegression'):
+            raise TypeError(f"Cannot compile {[type(step).__name__ for step in steps]}")
+        
+        n_features = np.shape(estimator.coef_)[-1]
+        mean, scale = np.zeros(n_features), np.ones(n_features)
+        if len(steps) == 2:
+            scaler = steps[0]
+            if type(scaler).__name__ != 'StandardScaler':
+                raise TypeError(f"Cannot compile preprocessing step {type(scaler).__name__}")
+            if scaler.mean_ is not None:
+                mean = scaler.mean_
+            if scaler.scale_ is not None:
+                scale = scaler.scale_
+        
+        return cls(
+            mean, scale, estimator.coef_, estimator.intercept_,
+            getattr(estimator, 'classes_', None),
+            getattr(pipeline, 'feature_names_in_', None)
+        )
+    
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(
+                arrays['mean'], arrays['scale'], arrays['coef'], arrays['intercept'],
+                arrays['classes'] if 'classes' in arrays else None,
+                arrays['feature_names'] if 'feature_names' in arrays else None,
+                str(arrays['source_sha256']) if 'source_sha256' in arrays else None
+            )
+    
+    def save(self, path):
+        arrays = {'mean': self.mean, 'scale': self.scale, 'coef': self.coef, 'intercept': self.intercept}
+        if self.classes is not None:
+            arrays['classes'] = self.classes
+        if self.feature_names_in_ is not None:
+            arrays['feature_names'] = self.feature_names_in_
+        if self.source_sha256 is not None:
+            arrays['source_sha256'] = np.asarray(self.source_sha256)
+        np.savez(path, **arrays)
+    
+    def decision_function(self, X):
+        X = np.array(X, dtype=np.float64, ndmin=2)
+        X -= self.mean
+        X /= self.scale
+        scores = X @ self.coef.T + self.intercept
+        return scores.reshape(-1) if scores.ndim > 1 and scores.shape[1] == 1 else scores
+    
+    def predict(self, X):
+        scores = self.decision_function(X)
+        if self.classes is None:
+            return scores
+        indices = (scores > 0).astype(int) if scores.ndim == 1 else scores.argmax(axis=1)
+        return self.classes[indices]
+    
+    def verify(self, pipeline, X):
+        """Raise ValueError unless predict() is bit-identical to the pipeline on X"""
+        expected, actual = np.asarray(pipeline.predict(X)), self.predict(X)
+        if expected.dtype != actual.dtype or not np.array_equal(expected, actual):
+            mismatched = int(np.sum(expected != actual)) if expected.shape == actual.shape else len(X)
+            raise ValueError(f"Compiled model differs from the pipeline on {mismatched}/{len(X)} rows")
+    
+    def sample_inputs(self, n, seed=0):
+        """Test rows spread over +-4 standard deviations of the training data"""
+        rng = np.random.default_rng(seed)
+        return self.mean + self.scale * rng.uniform(-4, 4, size=(n, len(self.mean)))
+
 class WateringSystem:
     """
     A class to encapsulate the watering decision system logic
@@ -38,66 +165,341 @@ class WateringSystem:
             logger.error(f"Error loading {name}: {e}")
             return None
     
+    def _load_compiled(self, compiled_path, path, name):
+        """
+        Load a model as a CompiledLinearModel: from its .npz export when that was
+        made from the current .pkl, otherwise by compiling the pickled pipeline
+        in memory. Falls back to the sklearn estimator when it cannot be compiled.
+        """
+        if USE_COMPILED_MODELS and os.path.exists(compiled_path):
+            try:
+                model = CompiledLinearModel.load(compiled_path)
+                if os.path.exists(path) and model.source_sha256 != file_sha256(path):
+                    logger.warning(f"{compiled_path} was not exported from the current {path}, re-run export_models.py")
+                else:
+                    logger.info(f"{name} loaded from {compiled_path}")
+                    return model
+            except Exception as e:
+                logger.error(f"Error loading {compiled_path}: {e}")
+        
+        model = self._load_model(path, name)
+        if model is None or not USE_COMPILED_MODELS:
+            return model
+        
+        try:
+            compiled = CompiledLinearModel.from_pipeline(model)
+            compiled.verify(model, compiled.sample_inputs(1000))
+            return compiled
+        except (TypeError, ValueError) as e:
+            logger.warning(f"{name} kept as sklearn estimator: {e}")
+            return model
+    
     def __init__(self):
         """Initialize the watering system by loading trained models"""
         os.makedirs(MODEL_DIR, exist_ok=True)
         
-        self.decision_model = self._load_model(DECISION_MODEL_PATH, "Watering decision model")
-        self.amount_model = self._load_model(AMOUNT_MODEL_PATH, "Water amount model")
+        self.decision_model = self._load_compiled(DECISION_COMPILED_PATH, DECISION_MODEL_PATH, "Watering decision model")
+        self.amount_model = self._load_compiled(AMOUNT_COMPILED_PATH, AMOUNT_MODEL_PATH, "Water amount model")
             
         # Define the features used by our models
         self.features = [
             'soil_moisture_1(%)', 'soil_moisture_2(%)', 'temperature(°C)', 
             'light_level(lux)', 'water_level(%)', 'hour', 'day_of_week'
         ]
+        
+        for name, model in (("decision model", self.decision_model), ("amount model", self.amount_model)):
+            fitted = getattr(model, 'feature_names_in_', None)
+            if fitted is not None and list(fitted) != self.features:
+                raise ValueError(f"Watering {name} was fitted on columns {list(fitted)}, expected {self.features}")
+    
+    def feature_row(self, data):
+        """
+        Pack a JSON reading into a (1, n_features) float64 row in self.features order.
+        Raises KeyError for a missing field, TypeError/ValueError for a non-numeric one.
+        """
+        row = np.empty((1, len(self.features)), dtype=np.float64)
+        for j, feature in enumerate(self.features):
+            row[0, j] = float(data[feature])
+        return self._check_finite(row)
+    
+    @staticmethod
+    def _check_finite(features):
+        """NaN/inf would flow through the compiled models into the response (and break JSON)"""
+        if not np.isfinite(features).all():
+            raise ValueError("Sensor values must be finite numbers")
+        return features
+    
+    def _feature_matrix(self, sensor_data):
+        """float64 matrix in self.features order from a DataFrame, a mapping or an array"""
+        if hasattr(sensor_data, 'columns'):
+            for feature in self.features:
+                if feature not in sensor_data.columns:
+                    raise KeyError(feature)
+            return self._check_finite(sensor_data[self.features].to_numpy(dtype=np.float64))
+        if hasattr(sensor_data, 'keys'):
+            return self.feature_row(sensor_data)
+        return self._check_finite(np.asarray(sensor_data, dtype=np.float64).reshape(-1, len(self.features)))
+    
+    def _decision_result(self, row, should_water, water_amount, timestamp):
+        return {
+            "success": True,
+            "should_water": bool(should_water),
+            "soil_moisture_1": float(row[0]),
+            "soil_moisture_2": float(row[1]),
+            "temperature": float(row[2]),
+            "light_level": float(row[3]),
+            "water_level": float(row[4]),
+            "timestamp": timestamp,
+            "hour": int(row[5]),
+            "day_of_week": int(row[6]),
+            "water_amount_litres": float(water_amount)
+        }
     
     def make_watering_decision(self, sensor_data):
         """
-        Decide whether to water based on sensor data
+        Decide whether to water based on sensor data: a DataFrame (first row is used),
+        a mapping of feature name -> value, or a float64 row from feature_row()
         """
         if self.decision_model is None:
             return {"error": "Decision model not loaded", "success": False}
             
         if sensor_data is None:
             return {"error": "No sensor data provided", "success": False}
-            
-        # Ensure all required features are present
-        for feature in self.features:
-            if feature not in sensor_data.columns:
-                return {"error": f"Missing feature: {feature}", "success": False}
+        
+        try:
+            features = self._feature_matrix(sensor_data)[:1]
+        except KeyError as e:
+            return {"error": f"Missing feature: {e.args[0]}", "success": False}
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid sensor data: {e}", "success": False}
                 
         try:
             # Make watering decision prediction
-            should_water = self.decision_model.predict(sensor_data[self.features])[0]
-            
-            result = {
-                "success": True,
-                "should_water": bool(should_water),
-                "soil_moisture_1": float(sensor_data['soil_moisture_1(%)'].values[0]),
-                "soil_moisture_2": float(sensor_data['soil_moisture_2(%)'].values[0]),
-                "temperature": float(sensor_data['temperature(°C)'].values[0]),
-                "light_level": float(sensor_data['light_level(lux)'].values[0]),
-                "water_level": float(sensor_data['water_level(%)'].values[0]),
-                "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                "hour": int(sensor_data['hour'].values[0]),
-                "day_of_week": int(sensor_data['day_of_week'].values[0])
-            }
+            should_water = self.decision_model.predict(features)[0]
             
             # If watering is needed, predict amount
+            water_amount = 0.0
             if should_water and self.amount_model is not None:
-                water_amount = self.amount_model.predict(sensor_data[self.features])[0]
-                result["water_amount_litres"] = float(water_amount)
-            else:
-                result["water_amount_litres"] = 0.0
+                water_amount = self.amount_model.predict(features)[0]
                 
-            return result
+            return self._decision_result(
+                features[0], should_water, water_amount, datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            )
             
         except Exception as e:
             logger.error(f"Error making prediction: {e}")
             return {"error": f"Prediction error: {str(e)}", "success": False}
+    
+    def _score(self, features):
+        """(should_water, water_amount_litres) arrays for a float64 feature matrix"""
+        should_water = np.asarray(self.decision_model.predict(features), dtype=bool)
+        
+        amounts = np.zeros(len(features))
+        if self.amount_model is not None and should_water.any():
+            amounts[should_water] = self.amount_model.predict(features[should_water])
+        return should_water, amounts
+    
+    def make_watering_decisions(self, sensor_data):
+        """
+        Decide for many readings at once: one decision model call over all rows,
+        one amount model call over only the rows that need watering
+        """
+        if self.decision_model is None:
+            return {"error": "Decision model not loaded", "success": False}
+        
+        try:
+            features = self._feature_matrix(sensor_data)
+        except KeyError as e:
+            return {"error": f"Missing feature: {e.args[0]}", "success": False}
+        except (TypeError, ValueError) as e:
+            return {"error": f"Invalid sensor data: {e}", "success": False}
+        
+        try:
+            should_water, amounts = self._score(features)
+            
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            return [
+                self._decision_result(row, water, amount, timestamp)
+                for row, water, amount in zip(features, should_water, amounts)
+            ]
+        
+        except Exception as e:
+            logger.error(f"Error making batch prediction: {e}")
+            return {"error": f"Prediction error: {str(e)}", "success": False}
+    
+    def plan_watering(self, features, times, min_interval_hours=PLAN_MIN_INTERVAL_HOURS):
+        """
+        Score one feature row per forecast hour in a single pass, then recommend
+        each flagged hour that is at least min_interval_hours after the previous slot
+        """
+        if self.decision_model is None:
+            return {"error": "Decision model not loaded", "success": False}
+        
+        try:
+            should_water, amounts = self._score(features)
+        except Exception as e:
+            logger.error(f"Error planning watering: {e}")
+            return {"error": f"Prediction error: {str(e)}", "success": False}
+        
+        slots, last = [], None
+        for i in np.flatnonzero(should_water):
+            if last is None or (times[i] - times[last]).total_seconds() >= min_interval_hours * 3600:
+                slots.append(int(i))
+                last = i
+        
+        return {"success": True, "should_water": should_water, "water_amount_litres": amounts, "slots": slots}
+
+def parse_aware_time(value):
+    """ISO timestamp -> timezone-aware datetime, keeping its offset; naive input is this host's local time"""
+    moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return moment if moment.tzinfo else moment.astimezone()
+
+def parse_local_time(value):
+    """ISO timestamp -> naive local time, so hour/day_of_week match what the backend sends for "now" """
+    return parse_aware_time(value).astimezone().replace(tzinfo=None)
+
+class SensorWindow:
+    """Fixed-size ring buffer of (timestamp, value) readings for one sensor"""
+    __slots__ = ('timestamps', 'values', 'head', 'count')
+    
+    def __init__(self, size):
+        self.timestamps = np.zeros(size, dtype=np.float64)
+        self.values = np.zeros(size, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+    
+    def append(self, timestamp, value):
+        self.timestamps[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % len(self.values)
+        self.count = min(self.count + 1, len(self.values))
+    
+    def latest(self):
+        """(timestamp, value) of the newest reading; readings may arrive out of order"""
+        i = int(np.argmax(self.timestamps[:self.count]))
+        return float(self.timestamps[i]), float(self.values[i])
+    
+    def window(self):
+        """(timestamps, values) of the buffered readings, oldest first"""
+        order = np.argsort(self.timestamps[:self.count], kind='stable')
+        return self.timestamps[order], self.values[order]
+
+class GardenSensors:
+    """The sensor windows of one garden"""
+    __slots__ = ('windows', 'last_seen')
+    
+    def __init__(self):
+        self.windows = {}
+        self.last_seen = 0.0
+
+class SensorStore:
+    """
+    Recent sensor readings per garden, so decisions can be scored from memory.
+    Memory is bounded: at most max_gardens gardens (least recently updated are
+    dropped first), SENSOR_TYPES windows each, window_size readings per window.
+    Gardens with no reading for stale_seconds are evicted.
+    """
+    
+    def __init__(self, window_size=SENSOR_WINDOW_SIZE, max_gardens=SENSOR_MAX_GARDENS,
+                 stale_seconds=SENSOR_STALE_SECONDS):
+        self.window_size = window_size
+        self.max_gardens = max_gardens
+        self.stale_seconds = stale_seconds
+        self._gardens = OrderedDict()
+        self._lock = threading.Lock()
+        self._ingested = 0
+        self._evicted = 0
+    
+    def ingest(self, garden_id, sensor_type, value, timestamp=None):
+        now = time.time()
+        with self._lock:
+            garden = self._gardens.get(garden_id)
+            if garden is None:
+                garden = self._gardens[garden_id] = GardenSensors()
+            else:
+                self._gardens.move_to_end(garden_id)
+            
+            window = garden.windows.get(sensor_type)
+            if window is None:
+                window = garden.windows[sensor_type] = SensorWindow(self.window_size)
+            window.append(now if timestamp is None else timestamp, value)
+            garden.last_seen = now
+            self._ingested += 1
+            
+            while len(self._gardens) > self.max_gardens:
+                self._gardens.popitem(last=False)
+                self._evicted += 1
+            self._evict_stale(now)
+    
+    def _evict_stale(self, now):
+        # Gardens are kept in last_seen order, so the stale ones are all at the front
+        while self._gardens:
+            garden_id, garden = next(iter(self._gardens.items()))
+            if now - garden.last_seen < self.stale_seconds:
+                break
+            del self._gardens[garden_id]
+            self._evicted += 1
+    
+    def latest(self, garden_id):
+        """{sensor_type: (timestamp, value)} for a garden, or None if it has no recent data"""
+        with self._lock:
+            self._evict_stale(time.time())
+            garden = self._gardens.get(garden_id)
+            if garden is None:
+                return None
+            return {sensor_type: window.latest() for sensor_type, window in garden.windows.items()}
+    
+    def window(self, garden_id, sensor_type):
+        """(timestamps, values) oldest first, or None"""
+        with self._lock:
+            garden = self._gardens.get(garden_id)
+            window = garden.windows.get(sensor_type) if garden is not None else None
+            return window.window() if window is not None else None
+    
+    def stats(self):
+        with self._lock:
+            windows = sum(len(garden.windows) for garden in self._gardens.values())
+            return {
+                "gardens": len(self._gardens),
+                "windows": windows,
+                "window_size": self.window_size,
+                "max_gardens": self.max_gardens,
+                "stale_seconds": self.stale_seconds,
+                "buffer_bytes": windows * self.window_size * 2 * 8,
+                "readings_ingested": self._ingested,
+                "gardens_evicted": self._evicted
+            }
+
+# Epoch values above this are milliseconds (as JavaScript/Java send them); in seconds it is year 5138
+EPOCH_MILLIS_THRESHOLD = 1e11
+
+def parse_reading_time(value):
+    """
+    Reading timestamp (ISO string, epoch seconds or epoch milliseconds) -> epoch
+    seconds, None for "now". A timestamp in the future would stay the window's
+    latest reading until it is pushed out, so anything past the allowed clock
+    skew is rejected along with non-finite and pre-epoch values.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError("timestamp must be an ISO string or epoch number, not a boolean")
+    if isinstance(value, (int, float)):
+        timestamp = float(value)
+        if abs(timestamp) >= EPOCH_MILLIS_THRESHOLD:
+            timestamp /= 1000.0
+    else:
+        timestamp = datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    
+    if not np.isfinite(timestamp) or timestamp < 0:
+        raise ValueError(f"timestamp out of range: {value}")
+    if timestamp > time.time() + SENSOR_MAX_CLOCK_SKEW_SECONDS:
+        raise ValueError(f"timestamp is in the future: {value}")
+    return timestamp
 
 # Initialize the watering system
 watering_system = WateringSystem()
+sensor_store = SensorStore()
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -112,18 +514,103 @@ def health_check():
             "decision_model": watering_system.decision_model is not None,
             "amount_model": watering_system.amount_model is not None
         },
+        "models_compiled": {
+            "decision_model": isinstance(watering_system.decision_model, CompiledLinearModel),
+            "amount_model": isinstance(watering_system.amount_model, CompiledLinearModel)
+        },
         "features": watering_system.features,
+        "sensor_store": sensor_store.stats(),
         "current_user": "VietTranDai"
     })
 
-@app.route('/watering/decision', methods=['POST'])
+@app.route('/sensors/readings', methods=['POST'])
+def post_sensor_readings():
+    """Ingest sensor readings as they arrive, for /watering/decision?garden_id="""
+    try:
+        data = request.get_json(silent=True)
+        readings = data.get('readings', [data]) if isinstance(data, dict) else data
+        
+        if not isinstance(readings, list) or not readings:
+            return jsonify({"error": "Expected a reading or a non-empty list of readings", "success": False}), 400
+        
+        errors = []
+        for i, reading in enumerate(readings):
+            try:
+                garden_id = reading['garden_id']
+                sensor_type = str(reading['sensor_type']).upper()
+                if sensor_type not in SENSOR_TYPES:
+                    raise ValueError(f"unknown sensor_type {sensor_type}")
+                if isinstance(reading['value'], bool):
+                    raise ValueError("value must be a number, not a boolean")
+                value = float(reading['value'])
+                if not np.isfinite(value):
+                    raise ValueError("value must be a finite number")
+                timestamp = parse_reading_time(reading.get('timestamp'))
+            except (KeyError, TypeError, ValueError) as e:
+                errors.append({"index": i, "error": f"Invalid reading: {e}"})
+                continue
+            sensor_store.ingest(str(garden_id), sensor_type, value, timestamp)
+        
+        # Partially accepted batches are still a 200 so the sender does not resend the good readings
+        accepted = len(readings) - len(errors)
+        return jsonify({
+            "success": not errors,
+            "accepted": accepted,
+            "errors": errors
+        }), 200 if accepted else 400
+    
+    except Exception as e:
+        logger.error(f"Error in sensor readings endpoint: {e}")
+        return jsonify({"error": str(e), "success": False}), 500
+
+def decision_from_memory(garden_id):
+    """Score a garden from its in-memory sensor windows instead of a posted reading"""
+    latest = sensor_store.latest(garden_id)
+    if latest is None:
+        return jsonify({"error": f"No recent sensor data for garden {garden_id}", "success": False}), 404
+    
+    missing_sensors = [sensor_type for sensor_type in REQUIRED_SENSOR_TYPES if sensor_type not in latest]
+    if missing_sensors:
+        return jsonify({"error": f"Missing sensor data: {missing_sensors}", "success": False}), 404
+    
+    try:
+        watering_time = request.args.get('watering_time')
+        moment = parse_local_time(watering_time) if watering_time else datetime.now()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid watering_time: {e}", "success": False}), 400
+    
+    soil_moisture = latest['SOIL_MOISTURE'][1]
+    water_level = latest['WATER_LEVEL'][1] if 'WATER_LEVEL' in latest else DEFAULT_WATER_LEVEL
+    row = np.array([[soil_moisture, soil_moisture, latest['TEMPERATURE'][1], latest['LIGHT'][1],
+                     water_level, moment.hour, moment.weekday()]], dtype=np.float64)
+    
+    result = watering_system.make_watering_decision(row)
+    if not result.get("success"):
+        return jsonify(result), 500
+    
+    result["garden_id"] = garden_id
+    result["sensor_readings"] = {
+        sensor_type: {"value": value, "timestamp": datetime.fromtimestamp(timestamp).isoformat()}
+        for sensor_type, (timestamp, value) in latest.items()
+    }
+    return jsonify(result), 200
+
+@app.route('/watering/decision', methods=['GET', 'POST'])
 def post_watering_decision():
-    """Get watering decision based on provided sensor data"""
+    """Get watering decision based on provided sensor data, or on ingested readings with ?garden_id="""
     try:
-        data = request.get_json()
+        garden_id = request.args.get('garden_id')
+        if garden_id is not None:
+            return decision_from_memory(garden_id)
         
-        if not data:
-            return jsonify({"error": "No data provided", "success": False}), 400
+        # GET has no body; only the ?garden_id= lookup above serves it
+        data = request.get_json(silent=True)
+        
+        if not data or not isinstance(data, dict):
+            return jsonify({
+                "error": "No data provided: POST a JSON sensor reading, or pass ?garden_id=",
+                "success": False
+            }), 400
         
         # Validate required fields
         required_fields = watering_system.features
@@ -135,9 +622,11 @@ def post_watering_decision():
                 "success": False,
                 "required_fields": required_fields
             }), 400
-            
-        # Convert to DataFrame
-        sensor_data = pd.DataFrame([data])
+        
+        try:
+            sensor_data = watering_system.feature_row(data)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Sensor values must be finite numbers", "success": False}), 400
         
         result = watering_system.make_watering_decision(sensor_data)
         
@@ -150,6 +639,171 @@ def post_watering_decision():
         logger.error(f"Error in watering decision POST endpoint: {e}")
         return jsonify({"error": str(e), "success": False}), 500
 
+@app.route('/watering/decision/batch', methods=['POST'])
+def post_watering_decision_batch():
+    """Get watering decisions for many gardens in one call, results in request order"""
+    try:
+        data = request.get_json(silent=True)
+        readings = data.get('readings') if isinstance(data, dict) else data
+        
+        if not isinstance(readings, list) or not readings:
+            return jsonify({"error": "Expected a non-empty list of readings", "success": False}), 400
+        
+        if len(readings) > MAX_BATCH_SIZE:
+            return jsonify({
+                "error": f"Too many readings: {len(readings)} (max {MAX_BATCH_SIZE})",
+                "success": False
+            }), 413
+        
+        # Validate each reading on its own so one bad row does not fail the sweep
+        required_fields = watering_system.features
+        results = [None] * len(readings)
+        valid_indices, rows = [], []
+        for i, reading in enumerate(readings):
+            if not isinstance(reading, dict):
+                results[i] = {"error": "Reading must be an object", "success": False}
+                continue
+            
+            missing_fields = [field for field in required_fields if field not in reading]
+            if missing_fields:
+                results[i] = {"error": f"Missing required fields: {missing_fields}", "success": False}
+                continue
+            
+            try:
+                row = [float(reading[field]) for field in required_fields]
+            except (TypeError, ValueError):
+                row = None
+            if row is None or not np.isfinite(row).all():
+                results[i] = {"error": "Sensor values must be finite numbers", "success": False}
+                continue
+            rows.append(row)
+            valid_indices.append(i)
+        
+        if rows:
+            sensor_data = np.array(rows, dtype=np.float64)
+            decisions = watering_system.make_watering_decisions(sensor_data)
+            if isinstance(decisions, dict):
+                return jsonify(decisions), 500
+            
+            for i, decision in zip(valid_indices, decisions):
+                results[i] = decision
+        
+        for reading, result in zip(readings, results):
+            if isinstance(reading, dict) and 'garden_id' in reading:
+                result["garden_id"] = reading['garden_id']
+        
+        return jsonify({
+            "success": True,
+            "total": len(results),
+            "succeeded": len(valid_indices),
+            "results": results,
+            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }), 200
+    
+    except Exception as e:
+        logger.error(f"Error in watering decision batch endpoint: {e}")
+        return jsonify({"error": str(e), "success": False}), 500
+
+@app.route('/watering/plan', methods=['POST'])
+def post_watering_plan():
+    """Recommend watering slots over an hourly forecast (up to 7 days) in one request"""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "No data provided", "success": False}), 400
+        
+        current = data.get('sensor_data')
+        forecast = data.get('forecast')
+        if not isinstance(current, dict):
+            return jsonify({"error": "sensor_data must be an object with the current readings", "success": False}), 400
+        if not isinstance(forecast, list) or not forecast:
+            return jsonify({"error": "forecast must be a non-empty list of hourly entries", "success": False}), 400
+        if len(forecast) > PLAN_MAX_HOURS:
+            return jsonify({
+                "error": f"Forecast too long: {len(forecast)} hours (max {PLAN_MAX_HOURS})",
+                "success": False
+            }), 400
+        
+        required_fields = ['soil_moisture_1(%)', 'soil_moisture_2(%)', 'water_level(%)']
+        missing_fields = [field for field in required_fields if field not in current]
+        if missing_fields:
+            return jsonify({
+                "error": f"Missing required fields in sensor_data: {missing_fields}",
+                "success": False,
+                "required_fields": required_fields
+            }), 400
+        
+        # One row per forecast hour: soil moisture and tank level stay at the current
+        # reading, temperature/light follow the forecast (falling back to the current reading)
+        try:
+            soil_moisture_1 = float(current['soil_moisture_1(%)'])
+            soil_moisture_2 = float(current['soil_moisture_2(%)'])
+            water_level = float(current['water_level(%)'])
+            
+            entries = []
+            for i, entry in enumerate(forecast):
+                # Aware, so slots are returned in the offset the client sent
+                moment = parse_aware_time(entry.get('forecastFor', entry.get('time')))
+                temperature = entry.get('temp', entry.get('temperature(°C)', current.get('temperature(°C)')))
+                light_level = entry.get('light_level(lux)', current.get('light_level(lux)'))
+                if temperature is None or light_level is None:
+                    raise ValueError(f"forecast[{i}] needs temp and light_level(lux) (or current readings for them)")
+                entries.append((moment, float(temperature), float(light_level)))
+        except (AttributeError, TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid plan data: {e}", "success": False}), 400
+        
+        entries.sort(key=lambda entry: entry[0])
+        times = [entry[0] for entry in entries]
+        features = np.empty((len(entries), len(watering_system.features)), dtype=np.float64)
+        for i, (moment, temperature, light_level) in enumerate(entries):
+            local = moment.astimezone()
+            features[i] = (soil_moisture_1, soil_moisture_2, temperature, light_level, water_level,
+                           local.hour, local.weekday())
+        if not np.isfinite(features).all():
+            return jsonify({"error": "Sensor and forecast values must be finite numbers", "success": False}), 400
+        
+        try:
+            min_interval_hours = float(data.get('min_interval_hours', PLAN_MIN_INTERVAL_HOURS))
+        except (TypeError, ValueError):
+            min_interval_hours = None
+        if min_interval_hours is None or not np.isfinite(min_interval_hours):
+            return jsonify({"error": "min_interval_hours must be a number", "success": False}), 400
+        
+        plan = watering_system.plan_watering(features, times, min_interval_hours)
+        if not plan.get("success"):
+            return jsonify(plan), 500
+        
+        amounts = plan["water_amount_litres"]
+        slots = [
+            {
+                "scheduled_at": times[i].isoformat(),
+                "hour": int(features[i, 5]),
+                "day_of_week": int(features[i, 6]),
+                "temperature": float(features[i, 2]),
+                "light_level": float(features[i, 3]),
+                "water_amount_litres": float(amounts[i])
+            }
+            for i in plan["slots"]
+        ]
+        
+        return jsonify({
+            "success": True,
+            "total_hours": len(times),
+            "hours_needing_water": int(plan["should_water"].sum()),
+            "slots": slots,
+            "total_water_litres": float(sum(slot["water_amount_litres"] for slot in slots)),
+            "hourly": {
+                "time": [moment.isoformat() for moment in times],
+                "should_water": plan["should_water"].tolist(),
+                "water_amount_litres": amounts.tolist()
+            },
+            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }), 200
+    
+    except Exception as e:
+        logger.error(f"Error in watering plan endpoint: {e}")
+        return jsonify({"error": str(e), "success": False}), 500
+
 @app.route('/')
 def index():
     """Render the test UI"""
@@ -160,7 +814,7 @@ def not_found(error):
     return jsonify({
         "error": "Endpoint not found", 
         "success": False,
-        "available_endpoints": ["/", "/health", "/watering/decision"]
+        "available_endpoints": ["/", "/health", "/watering/decision", "/watering/decision/batch", "/watering/plan", "/sensors/readings"]
     }), 404
 
 @app.errorhandler(500)
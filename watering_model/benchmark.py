@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Smart Watering System - Benchmarks
+Author: VietTranDai
+
+Usage:
+    python benchmark.py decision [--iterations 5000]
+    python benchmark.py models [--iterations 5000] [--rows 1 1000 100000]
+
+Prints a JSON report (or writes it with --output) so results can be diffed
+between commits.
+"""
+
+import os
+import sys
+import json
+import argparse
+import platform
+import statistics
+import time
+from datetime import datetime
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE_READING = {
+    'soil_moisture_1(%)': 35.0,
+    'soil_moisture_2(%)': 35.0,
+    'temperature(°C)': 25.0,
+    'light_level(lux)': 1500.0,
+    'water_level(%)': 80.0,
+    'hour': 10,
+    'day_of_week': 2
+}
+
+def load_service():
+    """Import app.py from this directory (models are resolved relative to it)"""
+    os.chdir(SERVICE_DIR)
+    sys.path.insert(0, SERVICE_DIR)
+    import app
+    return app
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'iterations': len(samples),
+        'mean_us': round(statistics.fmean(samples) * 1e6, 2),
+        'p50_us': round(samples[len(samples) // 2] * 1e6, 2),
+        'p99_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6, 2)
+    }
+
+def time_calls(fn, iterations):
+    for _ in range(min(100, iterations)):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+# ================= DECISION BENCHMARK ================= #
+
+def bench_decision(args):
+    """Per-request cost of the old DataFrame path vs the float64 row fast path"""
+    app = load_service()
+    system = app.watering_system
+    import pandas as pd
+
+    def dataframe_path():
+        return system.make_watering_decision(pd.DataFrame([SAMPLE_READING]))
+
+    def numpy_path():
+        return system.make_watering_decision(system.feature_row(SAMPLE_READING))
+
+    assert dataframe_path()['should_water'] == numpy_path()['should_water']
+
+    report = {
+        'dataframe': time_calls(dataframe_path, args.iterations),
+        'numpy': time_calls(numpy_path, args.iterations)
+    }
+    report['speedup'] = round(report['dataframe']['mean_us'] / report['numpy']['mean_us'], 2)
+    return report
+
+# ================= MODEL BENCHMARK ================= #
+
+def bench_models(args):
+    """sklearn pipeline vs CompiledLinearModel predict() per batch size"""
+    app = load_service()
+    import joblib
+
+    report = {}
+    for name, path in (('decision', app.DECISION_MODEL_PATH), ('amount', app.AMOUNT_MODEL_PATH)):
+        pipeline = joblib.load(path)
+        compiled = app.CompiledLinearModel.from_pipeline(pipeline)
+        report[name] = {}
+        for rows in args.rows:
+            X = compiled.sample_inputs(rows)
+            compiled.verify(pipeline, X)
+            iterations = max(10, args.iterations // rows)
+            sklearn_stats = time_calls(lambda: pipeline.predict(X), iterations)
+            compiled_stats = time_calls(lambda: compiled.predict(X), iterations)
+            report[name][str(rows)] = {
+                'sklearn': sklearn_stats,
+                'compiled': compiled_stats,
+                'speedup': round(sklearn_stats['mean_us'] / compiled_stats['mean_us'], 2)
+            }
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Smart Watering System benchmarks')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    decision = subparsers.add_parser('decision', help='Single-reading decision latency per input path')
+    decision.add_argument('--iterations', type=int, default=5000)
+    decision.set_defaults(func=bench_decision)
+
+    models = subparsers.add_parser('models', help='sklearn vs compiled model latency per batch size')
+    models.add_argument('--iterations', type=int, default=5000)
+    models.add_argument('--rows', type=int, nargs='+', default=[1, 1000, 100000])
+    models.set_defaults(func=bench_models)
+
+    args = parser.parse_args(argv)
+    report = {
+        'command': args.command,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'timestamp': datetime.now().isoformat(),
+        'results': args.func(args)
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Smart Watering System - Model export
+Author: VietTranDai
+
+Flattens the pickled sklearn pipelines in models/ into .npz arrays that the
+service loads without unpickling, after checking the arrays reproduce the
+pipeline predictions bit for bit.
+
+Usage:
+    python export_models.py [--rows 100000] [--seed 0]
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+import joblib
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export watering models to NumPy arrays')
+    parser.add_argument('--rows', type=int, default=100000, help='Rows in the verification set')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    os.chdir(SERVICE_DIR)
+    sys.path.insert(0, SERVICE_DIR)
+    from app import (CompiledLinearModel, file_sha256, DECISION_MODEL_PATH, AMOUNT_MODEL_PATH,
+                     DECISION_COMPILED_PATH, AMOUNT_COMPILED_PATH)
+
+    for path, compiled_path in ((DECISION_MODEL_PATH, DECISION_COMPILED_PATH),
+                                (AMOUNT_MODEL_PATH, AMOUNT_COMPILED_PATH)):
+        pipeline = joblib.load(path)
+        compiled = CompiledLinearModel.from_pipeline(pipeline)
+        compiled.source_sha256 = file_sha256(path)
+
+        X = compiled.sample_inputs(args.rows, args.seed)
+        compiled.verify(pipeline, X)
+        # Single rows go through a different BLAS kernel than matrices, check those too
+        for row in X[:1000]:
+            compiled.verify(pipeline, row[np.newaxis])
+
+        compiled.save(compiled_path)
+        reloaded = CompiledLinearModel.load(compiled_path)
+        reloaded.verify(pipeline, X)
+        assert reloaded.source_sha256 == compiled.source_sha256
+        logging.info(f"{path} -> {compiled_path}: identical on {args.rows} rows")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main()